@@ -0,0 +1,158 @@
+"""
+管理接口：按需性能分析、菜谱批量导出/导入
+所有接口需要请求头 X-Admin-Token 与环境变量 ADMIN_TOKEN 一致；未配置 ADMIN_TOKEN 时整个管理接口不可用（404）。
+"""
+import os
+import hmac
+import asyncio
+import logging
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from anyio import from_thread
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+from app.core import database, profiling
+from app.services import recipe_io
+
+logger = logging.getLogger(__name__)
+
+# 同一时间只允许一个按需采样，避免多个采样叠加放大开销
+_profile_lock = asyncio.Lock()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """校验管理员令牌"""
+    expected = os.getenv("ADMIN_TOKEN") or ""
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not Found")
+    # 按字节比较：compare_digest 不接受含非 ASCII 字符的 str
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), expected.encode()):
+        raise HTTPException(status_code=403, detail="管理员令牌无效")
+
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(require_admin)]
+)
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10, gt=0, le=60, description="采样时长（秒）"),
+    interval_ms: float = Query(10, ge=1, le=1000, description="采样间隔（毫秒）"),
+    mode: str = Query("all", pattern="^(threads|tasks|all)$", description="threads: 线程栈; tasks: asyncio 任务; all: 两者"),
+) -> PlainTextResponse:
+    """
+    按需采样 N 秒，返回 folded stacks 文本（可用 flamegraph.pl 或 speedscope 生成火焰图）
+    """
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="已有采样正在进行，请稍后重试")
+
+    async with _profile_lock:
+        logger.info(f"开始按需采样: mode={mode}, seconds={seconds}, interval_ms={interval_ms}")
+        interval = interval_ms / 1000
+        jobs = []
+        if mode in ("threads", "all"):
+            jobs.append(run_in_threadpool(profiling.profile_threads, seconds, interval))
+        if mode in ("tasks", "all"):
+            jobs.append(profiling.profile_tasks(seconds, interval))
+        counter: Counter = Counter()
+        for result in await asyncio.gather(*jobs):
+            counter.update(result)
+
+    return PlainTextResponse(profiling.fold(counter))
+
+
+@router.get("/profile/tasks", response_class=PlainTextResponse)
+async def task_dump() -> PlainTextResponse:
+    """当前所有 asyncio 任务的 await 栈快照"""
+    return PlainTextResponse(profiling.dump_tasks())
+
+
+@router.get("/slow-requests", response_model=Dict[str, Any])
+async def slow_requests() -> Dict[str, Any]:
+    """已捕获的慢请求列表"""
+    profiler = profiling.slow_request_profiler
+    return {
+        "success": True,
+        "data": {
+            "enabled": profiler.enabled,
+            "threshold_ms": profiler.threshold * 1000 if profiler.threshold else None,
+            "requests": profiler.list()
+        },
+        "message": "慢请求采样列表" if profiler.enabled else "慢请求捕获未开启（设置 SLOW_REQUEST_THRESHOLD_MS 开启）"
+    }
+
+
+@router.get("/slow-requests/{profile_id}", response_class=PlainTextResponse)
+async def slow_request_profile(profile_id: int) -> PlainTextResponse:
+    """单个慢请求的 folded stacks 采样"""
+    record = profiling.slow_request_profiler.get(profile_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="未找到该慢请求采样")
+    return PlainTextResponse(record["folded"])
+
+
+@router.get("/recipes/export")
+async def export_recipes(
+    batch_size: int = Query(recipe_io.DEFAULT_BATCH_SIZE, ge=1, le=10000, description="每批从数据库读取的行数"),
+) -> StreamingResponse:
+    """
+    以 NDJSON 流式导出 recipes 表，内存占用与表大小无关
+    """
+    def generate():
+        db = database.get_session_local()()
+        stats = recipe_io.TransferStats()
+        try:
+            yield from recipe_io.export_ndjson(db, batch_size=batch_size, stats=stats)
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=recipes.ndjson"}
+    )
+
+
+@router.post("/recipes/import", response_model=Dict[str, Any])
+async def import_recipes(
+    request: Request,
+    batch_size: int = Query(recipe_io.DEFAULT_BATCH_SIZE, ge=1, le=5000, description="每条 INSERT 的行数"),
+) -> Dict[str, Any]:
+    """
+    从请求体流式导入 NDJSON 菜谱：按内容哈希去重，分批多行插入，返回处理统计
+    导入在线程池中执行，请求体按块从事件循环读取，内存占用只与 batch_size 有关。
+    """
+    body = request.stream().__aiter__()
+
+    def chunks():
+        # 在工作线程中逐块读取请求体（读取本身仍在事件循环上执行）
+        while True:
+            try:
+                yield from_thread.run(body.__anext__)
+            except StopAsyncIteration:
+                return
+
+    stats = recipe_io.TransferStats()
+    db = database.get_session_local()()
+    try:
+        await run_in_threadpool(
+            recipe_io.import_ndjson, db, recipe_io.iter_lines(chunks()), batch_size=batch_size, stats=stats
+        )
+    except Exception as e:
+        logger.error(f"菜谱导入失败: {e}", exc_info=True)
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"导入中断，已提交 {stats.inserted} 条: {e}")
+    finally:
+        db.close()
+
+    return {
+        "success": True,
+        "data": stats.as_dict(),
+        "message": f"导入完成：新增 {stats.inserted} 条，重复 {stats.duplicates} 条，无效 {stats.invalid} 条"
+    }
@@ -2,15 +2,28 @@
 聊天API路由 V4 - 最终清理版
 """
 import json
-from fastapi import APIRouter, HTTPException, UploadFile, File, Depends
-from typing import Dict, Any
+from uuid import uuid4
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends
+from fastapi.concurrency import run_in_threadpool
+from typing import Dict, Any, Optional
 import logging
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from app.models import schemas as api_schemas
 from app.models import recipe as db_models
 from app.core import database, storage
-from app.services import get_vision_service
+from app.core.circuit_breaker import CircuitOpenError, is_outage
+from app.services import (
+    get_vision_service,
+    get_conversation_store,
+    get_fallback_index,
+    get_deferred_queue,
+    get_health_monitor,
+    collect_metrics,
+)
+from app.services import recipe_io
+from app.models.deferred_job import DeferredJob
 
 logger = logging.getLogger(__name__)
 
@@ -20,113 +33,353 @@ router = APIRouter(
 )
 
 
+def _save_recipe(db: Session, recipe_obj: api_schemas.Recipe, image_url: Optional[str]) -> db_models.Recipe:
+    """将Pydantic菜谱对象存入数据库并返回ORM记录"""
+    # BUG修复：正确地将Pydantic对象列表转换为JSON字符串
+    ingredients_json = json.dumps([i.model_dump() for i in recipe_obj.ingredients], ensure_ascii=False)
+    steps_json = json.dumps([s.model_dump() for s in recipe_obj.steps], ensure_ascii=False)
+
+    new_recipe_db = db_models.Recipe(
+        recipe_name=recipe_obj.dish_name,
+        ingredients=ingredients_json,
+        steps=steps_json,
+        image_url=image_url,
+        cooking_time=recipe_obj.cooking_time,
+        difficulty=recipe_obj.difficulty,
+        _openid="",  # 暂时留空
+        content_hash=recipe_io.content_hash(
+            recipe_obj.dish_name, ingredients_json, steps_json, recipe_obj.cooking_time, recipe_obj.difficulty
+        )
+    )
+
+    db.add(new_recipe_db)
+    try:
+        db.commit()
+    except IntegrityError:
+        # 已有内容相同的菜谱（content_hash 唯一）：仍然保存本条，哈希留空
+        db.rollback()
+        new_recipe_db.content_hash = None
+        db.add(new_recipe_db)
+        db.commit()
+    db.refresh(new_recipe_db)
+    return new_recipe_db
+
+
+def _save_recipe_guarded(db: Session, recipe_obj: api_schemas.Recipe, image_url: Optional[str]) -> db_models.Recipe:
+    """
+    经数据库熔断器保存菜谱，并加入降级菜谱索引
+    数据库熔断时返回 503，其他数据库错误返回 500。
+    """
+    try:
+        new_recipe_db = database.db_breaker.call(_save_recipe, db, recipe_obj, image_url)
+    except CircuitOpenError as e:
+        logger.warning(f"数据库已熔断，拒绝保存菜谱: {e}")
+        raise HTTPException(status_code=503, detail="数据库暂不可用，请稍后重试")
+    except Exception as e:
+        logger.error(f"数据库存储失败: {e}", exc_info=True)
+        db.rollback()
+        raise HTTPException(status_code=500, detail="服务器内部错误，无法保存菜谱")
+
+    logger.info(f"菜谱 '{new_recipe_db.recipe_name}' 已成功存入数据库, ID为: {new_recipe_db.id}")
+    get_fallback_index().add(new_recipe_db.id, [i.name for i in recipe_obj.ingredients])
+    return new_recipe_db
+
+
+def _require_database() -> None:
+    """
+    数据库熔断时立即返回 503：结果无法保存，不再为请求上传图片或调用模型
+    """
+    if not database.db_breaker.allow():
+        logger.warning("数据库已熔断，直接拒绝请求")
+        raise HTTPException(status_code=503, detail="数据库暂不可用，请稍后重试")
+
+
+def _release_connection(db: Session) -> None:
+    """
+    结束读取会话历史时自动开启的事务，把连接归还连接池：
+    等待模型（可能数十秒）期间不占用数据库连接
+    """
+    db.commit()
+
+
+def _context_text(conversation_id: str, db: Session, *texts: Optional[str]) -> str:
+    """降级查找已有菜谱时使用的文本：用户输入加上会话中最近的轮次"""
+    recent = get_conversation_store().recent_turns(conversation_id, db)
+    return " ".join([t for t in texts if t] + [turn.content for turn in recent])
+
+
+def _update_image_url(db: Session, recipe_id: int, image_url: str) -> None:
+    db.query(db_models.Recipe).filter(db_models.Recipe.id == recipe_id).update({"image_url": image_url})
+    db.commit()
+
+
+def _job_file_name(file_name: Optional[str]) -> str:
+    # deferred_jobs.file_name 最长 255 个字符，保留末尾以保留扩展名
+    return (file_name or "")[-255:]
+
+
+def _defer_image_upload(db: Session, recipe_id: int, image_bytes: bytes, file_name: str) -> Optional[DeferredJob]:
+    """COS 不可用时，把图片连同任务写入数据库，在 COS 恢复后上传并回填菜谱的 image_url"""
+    return get_deferred_queue().submit(
+        db, "image_upload", recipe_id=recipe_id, image_data=image_bytes, file_name=_job_file_name(file_name)
+    )
+
+
+async def _run_image_upload(db: Session, job: DeferredJob) -> None:
+    image_url = await run_in_threadpool(storage.upload_to_cos, job.image_data, job.file_name)
+    database.db_breaker.call(_update_image_url, db, job.recipe_id, image_url)
+    job.image_url = image_url
+
+
+def _defer_recipe_generation(db: Session, conversation_id: str, image_bytes: bytes, file_name: str,
+                             image_url: Optional[str], description: Optional[str]) -> Optional[DeferredJob]:
+    """模型不可用时，把图片连同任务写入数据库，在模型恢复后生成菜谱；客户端可按任务ID查询结果"""
+    return get_deferred_queue().submit(
+        db, "recipe_generation",
+        conversation_id=conversation_id,
+        description=description,
+        file_name=_job_file_name(file_name),
+        image_url=image_url,
+        image_data=image_bytes,
+    )
+
+
+async def _run_recipe_generation(db: Session, job: DeferredJob) -> None:
+    # 提交后 job 的属性会过期，先取出调用模型期间需要的字段
+    conversation_id, description = job.conversation_id, job.description
+    image_bytes, file_name = job.image_data, job.file_name
+    conversations = get_conversation_store()
+    history = conversations.build_context(conversation_id, db)
+    _release_connection(db)
+    recipe_obj = await get_vision_service().generate_recipe_from_image(
+        image_bytes, history=history, description=description
+    )
+    url = job.image_url
+    if url is None:
+        try:
+            url = await run_in_threadpool(storage.upload_to_cos, image_bytes, file_name)
+        except Exception as e:
+            logger.warning(f"延后生成菜谱时图片上传仍失败，图片将继续延后上传: {e}")
+    new_recipe_db = database.db_breaker.call(_save_recipe, db, recipe_obj, url)
+    get_fallback_index().add(new_recipe_db.id, [i.name for i in recipe_obj.ingredients])
+    if url is None:
+        _defer_image_upload(db, new_recipe_db.id, image_bytes, file_name)
+    conversations.add_image_turn(conversation_id, recipe_obj, new_recipe_db.id,
+                                 description=description, db=db)
+    job.image_url = url
+    job.recipe_id = new_recipe_db.id
+
+
+get_deferred_queue().register("image_upload", "cos", _run_image_upload)
+get_deferred_queue().register("recipe_generation", "model", _run_recipe_generation)
+
+
 @router.post("/image", response_model=api_schemas.RecipeCreationResponse)
 async def image_upload(
     file: UploadFile = File(..., description="上传的图片文件"),
+    conversation_id: Optional[str] = Form(None, max_length=64, description="会话ID，用于关联对话历史"),
+    description: Optional[str] = Form(None, max_length=500, description="图片描述或用户备注"),
     db: Session = Depends(database.get_db)
 ):
     """
     图片上传端点 (V4 - 统一模型)
     接收图片, 调用AI生成菜谱, 存入数据库并返回。
+    上游依赖熔断时降级：COS 不可用则延后上传图片；模型不可用则返回已有菜谱并排队稍后生成；
+    数据库不可用时直接返回 503。
     """
     logger.info(f"收到图片上传请求 (V4): {file.filename}")
 
     if not file.content_type or not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="不支持的图片格式，请上传JPG、PNG等图片格式")
 
-    # 步骤1: 读取图片并上传到云存储
+    conversation_id = conversation_id or str(uuid4())
+    conversations = get_conversation_store()
+
+    image_bytes = await file.read()
+    if not image_bytes:
+        raise HTTPException(status_code=400, detail="图片数据为空")
+
+    _require_database()
+
+    # 步骤1: 上传到云存储；失败时不中断，图片稍后补传
+    image_url: Optional[str] = None
     try:
-        image_bytes = await file.read()
-        if not image_bytes:
-            raise HTTPException(status_code=400, detail="图片数据为空")
-        image_url = storage.upload_to_cos(image_bytes, file.filename)
+        image_url = await run_in_threadpool(storage.upload_to_cos, image_bytes, file.filename)
         logger.info(f"图片成功上传到云存储: {image_url}")
     except Exception as e:
-        logger.error(f"图片上传至云存储失败: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="图片上传失败")
+        logger.warning(f"图片上传至云存储失败，图片将延后上传: {e}")
 
-    # 步骤2: 调用AI服务从图片直接生成菜谱
+    # 步骤2: 调用AI服务从图片直接生成菜谱（附带按token预算裁剪后的会话历史）
     try:
+        history = conversations.build_context(conversation_id, db)
+        _release_connection(db)
         vision_service = get_vision_service()
-        recipe_obj = await vision_service.generate_recipe_from_image(image_bytes)
+        recipe_obj = await vision_service.generate_recipe_from_image(
+            image_bytes, history=history, description=description
+        )
         logger.info(f"AI成功生成菜谱对象: {recipe_obj.dish_name}")
     except Exception as e:
-        logger.error(f"AI服务调用失败: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"AI服务处理失败: {str(e)}")
-
-    # 步骤3: 将菜谱存入数据库
-    try:
-        # BUG修复：正确地将Pydantic对象列表转换为JSON字符串
-        ingredients_json = json.dumps([i.model_dump() for i in recipe_obj.ingredients], ensure_ascii=False)
-        steps_json = json.dumps([s.model_dump() for s in recipe_obj.steps], ensure_ascii=False)
-
-        new_recipe_db = db_models.Recipe(
-            recipe_name=recipe_obj.dish_name,
-            ingredients=ingredients_json,
-            steps=steps_json,
-            image_url=image_url,
-            cooking_time=recipe_obj.cooking_time,
-            difficulty=recipe_obj.difficulty,
-            _openid=""  # 暂时留空
+        if not is_outage(e):
+            logger.error(f"AI服务调用失败: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"AI服务处理失败: {str(e)}")
+        logger.warning(f"AI服务暂不可用，进入降级模式: {e}")
+        job = _defer_recipe_generation(db, conversation_id, image_bytes, file.filename, image_url, description)
+        fallback = get_fallback_index().find(db, _context_text(conversation_id, db, description))
+        if fallback is None and job is None:
+            raise HTTPException(status_code=503, detail=f"AI服务暂不可用: {str(e)}")
+        message = "AI服务暂不可用，已为您推荐一道相近的已有菜谱" if fallback is not None else "AI服务暂不可用"
+        if job is not None:
+            message += f"；图片已接收，新菜谱将稍后生成，可通过 /api/chat/jobs/{job.id} 查询"
+        return api_schemas.RecipeCreationResponse(
+            success=True,
+            data=fallback,
+            message=message,
+            conversation_id=conversation_id,
+            degraded=True,
+            job_id=job.id if job is not None else None
         )
-        
-        db.add(new_recipe_db)
-        db.commit()
-        db.refresh(new_recipe_db)
-        logger.info(f"菜谱 '{new_recipe_db.recipe_name}' 已成功存入数据库, ID为: {new_recipe_db.id}")
-    except Exception as e:
-        logger.error(f"数据库存储失败: {e}", exc_info=True)
-        db.rollback()
-        raise HTTPException(status_code=500, detail="服务器内部错误，无法保存菜谱")
 
-    # 步骤4: 返回成功响应
+    # 步骤3: 将菜谱存入数据库；图片未上传成功时排队补传
+    new_recipe_db = _save_recipe_guarded(db, recipe_obj, image_url)
+    upload_job = None
+    if image_url is None:
+        upload_job = _defer_image_upload(db, new_recipe_db.id, image_bytes, file.filename)
+
+    # 步骤4: 记录会话轮次（图片以已生成的菜谱引用，不保存图片本身）
+    conversations.add_image_turn(conversation_id, recipe_obj, new_recipe_db.id, description=description, db=db)
+
+    # 步骤5: 返回成功响应
     return api_schemas.RecipeCreationResponse(
         success=True,
         data=new_recipe_db,
-        message="菜谱已根据您的图片生成并成功保存！"
+        message="菜谱已根据您的图片生成并成功保存！" if image_url else "菜谱已生成并保存，图片将稍后上传",
+        conversation_id=conversation_id,
+        degraded=image_url is None,
+        job_id=upload_job.id if upload_job is not None else None
     )
 
 
-@router.get("/health", response_model=Dict[str, Any])
-async def health_check() -> Dict[str, Any]:
+@router.post("/text", response_model=api_schemas.RecipeCreationResponse)
+async def text_query(
+    request: api_schemas.TextQueryRequest,
+    db: Session = Depends(database.get_db)
+):
     """
-    健康检查端点
+    文本查询端点
+    结合会话历史处理追问（例如“做得不那么辣”），生成新的菜谱并保存。
+    模型不可用时按消息和会话中的食材返回已有菜谱；数据库不可用时直接返回 503。
     """
-    logger.info("收到健康检查请求 (V4)")
-    all_ok = True
-    components = {}
+    logger.info(f"收到文本请求: conversation_id={request.conversation_id}")
+
+    _require_database()
+
+    conversation_id = request.conversation_id or str(uuid4())
+    conversations = get_conversation_store()
 
     try:
-        get_vision_service()
-        components["qwen_vision_service"] = "healthy"
+        history = conversations.build_context(conversation_id, db)
+        _release_connection(db)
+        vision_service = get_vision_service()
+        recipe_obj = await vision_service.generate_recipe_from_text(request.message, history=history)
+        logger.info(f"AI成功生成菜谱对象: {recipe_obj.dish_name}")
     except Exception as e:
-        components["qwen_vision_service"] = f"unhealthy: {str(e)}"
-        all_ok = False
-    
-    # 数据库连接检查（确保会话正确关闭）
+        if not is_outage(e):
+            logger.error(f"AI服务调用失败: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"AI服务处理失败: {str(e)}")
+        logger.warning(f"AI服务暂不可用，进入降级模式: {e}")
+        fallback = get_fallback_index().find(db, _context_text(conversation_id, db, request.message))
+        if fallback is None:
+            raise HTTPException(status_code=503, detail=f"AI服务暂不可用: {str(e)}")
+        return api_schemas.RecipeCreationResponse(
+            success=True,
+            data=fallback,
+            message="AI服务暂不可用，已为您推荐一道相近的已有菜谱",
+            conversation_id=conversation_id,
+            degraded=True
+        )
+
+    new_recipe_db = _save_recipe_guarded(db, recipe_obj, None)
+
+    conversations.add_text_turn(conversation_id, request.message, recipe_obj, new_recipe_db.id, db=db)
+
+    return api_schemas.RecipeCreationResponse(
+        success=True,
+        data=new_recipe_db,
+        message="菜谱已根据您的要求生成并成功保存！",
+        conversation_id=conversation_id
+    )
+
+
+@router.get("/jobs/{job_id}", response_model=api_schemas.DeferredJobResponse)
+async def deferred_job_status(job_id: int, db: Session = Depends(database.get_db)):
+    """
+    延后任务查询端点
+    降级响应中的 job_id 对应的任务状态；任务完成后返回生成（或回填了图片）的菜谱。
+    """
     try:
-        from sqlalchemy import text as sql_text
+        job = database.db_breaker.call(lambda: db.get(DeferredJob, job_id))
+        recipe = None
+        if job is not None and job.recipe_id is not None:
+            recipe = database.db_breaker.call(lambda: db.get(db_models.Recipe, job.recipe_id))
+    except CircuitOpenError:
+        raise HTTPException(status_code=503, detail="数据库暂不可用，请稍后重试")
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
 
-        SessionLocal = database.get_session_local()
-        db = SessionLocal()
-        try:
-            db.execute(sql_text("SELECT 1"))
-        finally:
-            db.close()
+    messages = {
+        "pending": "任务等待执行",
+        "running": "任务执行中",
+        "done": "任务已完成",
+        "failed": "任务多次重试后失败",
+    }
+    return api_schemas.DeferredJobResponse(
+        success=True,
+        data=api_schemas.DeferredJobSchema(
+            job_id=job.id,
+            kind=job.kind,
+            status=job.status,
+            attempts=job.attempts,
+            recipe=recipe
+        ),
+        message=messages.get(job.status, job.status)
+    )
 
-        components["database"] = "healthy"
-    except Exception as e:
-        components["database"] = f"unhealthy: {str(e)}"
-        all_ok = False
 
+@router.get("/health", response_model=Dict[str, Any])
+async def health_check() -> Dict[str, Any]:
+    """
+    健康检查端点
+    直接返回后台健康监控的缓存结果，不在请求路径上访问任何依赖。
+    """
+    readiness = get_health_monitor().readiness()
+    components = {
+        name: result["status"] if result["status"] != "unhealthy" else f"unhealthy: {result['error']}"
+        for name, result in readiness["components"].items()
+    }
+    all_ok = readiness["ready"] and all(
+        result["status"] == "healthy" for result in readiness["components"].values()
+    )
 
     return {
         "success": all_ok,
         "data": {
-            "service": "running",
-            "components": components
+            "service": "degraded" if readiness["degraded"] else "running",
+            "components": components,
+            "details": readiness["components"],
+            "breakers": readiness["breakers"]
         },
         "message": "服务运行正常" if all_ok else "服务存在问题，请检查组件状态"
     }
 
 
+@router.get("/metrics", response_model=Dict[str, Any])
+async def metrics() -> Dict[str, Any]:
+    """
+    运行指标端点
+    返回模型级联各档位的延迟、升级率和 token 消耗，熔断器状态和延后任务队列等统计。
+    """
+    return {
+        "success": True,
+        "data": collect_metrics(),
+        "message": "指标获取成功"
+    }
@@ -0,0 +1,29 @@
+"""
+存活/就绪探针路由
+供 Docker HEALTHCHECK 和编排系统使用，结果均来自后台健康监控的缓存，立即返回。
+"""
+from typing import Any, Dict
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.services import get_health_monitor
+
+router = APIRouter(tags=["health"])
+
+
+@router.get("/livez", response_model=Dict[str, Any])
+async def livez() -> Dict[str, Any]:
+    """
+    存活探针：进程和事件循环能够响应即为存活，不检查任何依赖
+    """
+    return get_health_monitor().liveness()
+
+
+@router.get("/readyz")
+async def readyz() -> JSONResponse:
+    """
+    就绪探针：关键依赖不健康、数据库熔断或连接池饱和时返回 503
+    """
+    readiness = get_health_monitor().readiness()
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
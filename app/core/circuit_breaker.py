@@ -0,0 +1,220 @@
+"""
+熔断器
+按依赖（模型、COS、数据库）分别统计连续失败；失败达到阈值后熔断（open），
+在恢复时间内直接拒绝调用，避免每个请求都等满超时；
+恢复时间过后进入半开（half_open）状态，放行少量探测请求，成功则恢复，失败则重新熔断。
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+from openai import APIConnectionError
+from sqlalchemy import exc as sa_exc
+
+try:
+    from qcloud_cos.cos_exception import CosClientError
+except ImportError:  # COS SDK 未安装时（例如只运行导入/导出脚本）
+    CosClientError = None
+
+
+logger = logging.getLogger(__name__)
+
+# 说明依赖本身不可用的异常：网络错误、超时、数据库连接/操作错误
+_OUTAGE_ERRORS: Tuple[Type[BaseException], ...] = tuple(
+    cls for cls in (
+        ConnectionError,
+        TimeoutError,
+        asyncio.TimeoutError,
+        APIConnectionError,
+        sa_exc.OperationalError,
+        sa_exc.InterfaceError,
+        sa_exc.DisconnectionError,
+        sa_exc.TimeoutError,
+        CosClientError,
+    ) if cls is not None
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断器处于打开状态，调用被直接拒绝"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"依赖 {name} 已熔断，{retry_after:.0f}s 后重试")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_outage(error: BaseException) -> bool:
+    """
+    异常是否说明依赖不可用：熔断、网络错误、超时、数据库连接/操作错误、限流 (429) 或服务端错误 (5xx)。
+    调用方自身的错误（模型返回 400/401、内容不合格、数据超长、唯一约束冲突等）说明依赖可用，不算故障。
+    """
+    if isinstance(error, CircuitOpenError) or isinstance(error, _OUTAGE_ERRORS):
+        return True
+    # OpenAI APIStatusError 使用 status_code，COS CosServiceError 使用 get_status_code()
+    status = getattr(error, "status_code", None)
+    if status is None and callable(getattr(error, "get_status_code", None)):
+        status = error.get_status_code()
+    try:
+        status = int(status)
+    except (TypeError, ValueError):
+        return False
+    return status == 429 or status >= 500
+
+
+class CircuitBreaker:
+    """
+    单个依赖的熔断器
+    只有 is_failure 判定为故障的异常计为失败；其他异常说明依赖本身可用，按成功处理。
+    """
+
+    def __init__(self, name: str, failure_threshold: Optional[int] = None,
+                 recovery_timeout: Optional[float] = None, half_open_max_calls: int = 1,
+                 is_failure: Callable[[BaseException], bool] = is_outage):
+        self.name = name
+        self.failure_threshold = failure_threshold or int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+        self.recovery_timeout = recovery_timeout or float(os.getenv("BREAKER_RECOVERY_TIMEOUT", "30"))
+        self.half_open_max_calls = half_open_max_calls
+        self.is_failure = is_failure
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+        self.total_calls = 0
+        self.total_failures = 0
+        self.total_rejected = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = HALF_OPEN
+            self._half_open_calls = 0
+            logger.info(f"熔断器 {self.name} 进入半开状态，开始探测")
+        return self._state
+
+    def allow(self) -> bool:
+        """当前是否允许调用（不占用半开探测名额）"""
+        return self.state != OPEN
+
+    def _before_call(self) -> None:
+        with self._lock:
+            state = self._current_state()
+            if state == OPEN or (state == HALF_OPEN and self._half_open_calls >= self.half_open_max_calls):
+                self.total_rejected += 1
+                retry_after = max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+                raise CircuitOpenError(self.name, retry_after)
+            if state == HALF_OPEN:
+                self._half_open_calls += 1
+            self.total_calls += 1
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"熔断器 {self.name} 探测成功，恢复闭合")
+            self._state = CLOSED
+            self._failures = 0
+
+    def record_failure(self, error: BaseException) -> None:
+        with self._lock:
+            self.total_failures += 1
+            self.last_error = str(error)
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    logger.warning(f"熔断器 {self.name} 打开: 连续失败 {self._failures} 次，最近错误: {error}")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def _release_probe(self) -> None:
+        # 调用被取消时既不算成功也不算失败，归还半开探测名额
+        with self._lock:
+            if self._state == HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def _on_error(self, error: BaseException) -> None:
+        if not isinstance(error, Exception):
+            self._release_probe()
+        elif self.is_failure(error):
+            self.record_failure(error)
+        else:
+            self.record_success()
+
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """通过熔断器执行同步调用"""
+        self._before_call()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            self._on_error(e)
+            raise
+        self.record_success()
+        return result
+
+    async def call_async(self, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """通过熔断器执行异步调用"""
+        self._before_call()
+        try:
+            result = await func(*args, **kwargs)
+        except BaseException as e:
+            self._on_error(e)
+            raise
+        self.record_success()
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state()
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "calls": self.total_calls,
+                "failures": self.total_failures,
+                "rejected": self.total_rejected,
+                "last_error": self.last_error,
+            }
+
+
+# 各依赖熔断器的配置集中在这里：无论哪个模块先获取，创建出的熔断器配置都相同
+# 默认只有 is_outage 判定的故障计入熔断
+BREAKER_CONFIG: Dict[str, Dict[str, Any]] = {
+    "model": {},
+    "cos": {},
+    "database": {},
+}
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """按依赖名获取（首次调用时按 BREAKER_CONFIG 创建）熔断器单例"""
+    if name not in BREAKER_CONFIG:
+        raise KeyError(f"未注册的熔断器: {name}（请在 BREAKER_CONFIG 中添加）")
+    with _registry_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name, **BREAKER_CONFIG[name])
+            _breakers[name] = breaker
+        return breaker
+
+
+def breaker_states() -> Dict[str, Dict[str, Any]]:
+    """所有已创建熔断器的状态快照，供健康检查和 metrics 使用"""
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return {b.name: b.snapshot() for b in breakers}
@@ -1,13 +1,24 @@
 import os
-from sqlalchemy import create_engine
+from typing import Any, Dict, Optional
+
+from sqlalchemy import Table, create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
+from .circuit_breaker import get_breaker
+
 Base = declarative_base()
 
+# 数据库写入熔断器：数据库不可用时快速失败，避免占用 worker 和会话等待超时
+db_breaker = get_breaker("database")
+
 _engine = None
 _SessionLocal = None
 
+# 连接池容量：就绪探针根据已占用连接数判断是否饱和
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
 
 def _read_mysql_env() -> tuple[str, str, str, str, str]:
     mysql_address = os.getenv("MYSQL_ADDRESS", "")
@@ -38,7 +49,12 @@ def get_engine():
         raise RuntimeError("MySQL 未配置：请在云托管绑定 MySQL，并设置 DB_NAME 或 MYSQL_DATABASE")
 
     url = f"mysql+pymysql://{user}:{password}@{host}:{port}/{db_name}"
-    _engine = create_engine(url, pool_pre_ping=True)
+    _engine = create_engine(
+        url,
+        pool_pre_ping=True,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+    )
     _SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=_engine)
     return _engine
 
@@ -58,3 +74,49 @@ def get_db():
     finally:
         db.close()
 
+
+def ping() -> None:
+    """执行 SELECT 1 检查数据库连通性（供后台健康检查使用）"""
+    SessionLocal = get_session_local()
+    db = SessionLocal()
+    try:
+        db.execute(text("SELECT 1"))
+    finally:
+        db.close()
+
+
+def pool_status() -> Optional[Dict[str, Any]]:
+    """连接池占用情况；Engine 尚未创建时返回 None"""
+    if _engine is None:
+        return None
+    pool = _engine.pool
+    capacity = POOL_SIZE + MAX_OVERFLOW
+    # 非 QueuePool（例如测试用的 StaticPool）没有 checkedout()
+    checked_out = pool.checkedout() if hasattr(pool, "checkedout") else 0
+    return {
+        "checked_out": checked_out,
+        "capacity": capacity,
+        "saturation": round(checked_out / capacity, 4) if capacity else 0.0,
+    }
+
+
+def add_missing_columns(engine, table: Table) -> None:
+    """
+    create_all 不会修改已存在的表：为已有表补充模型中新增的列（须为可空列）及其索引
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table(table.name):
+        return
+
+    existing = {column["name"] for column in inspector.get_columns(table.name)}
+    added = set()
+    with engine.begin() as conn:
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            added.add(column.name)
+        for index in table.indexes:
+            if any(column.name in added for column in index.columns):
+                index.create(conn)
@@ -0,0 +1,256 @@
+"""
+采样分析器
+纯 Python 实现，不依赖额外的系统包，可在 slim 镜像中使用：
+- 线程采样：后台线程定期读取 sys._current_frames()，看到 CPU 时间和阻塞调用花在哪里；
+- 协程采样：在事件循环上定期沿 await 链展开所有 asyncio 任务，看到 await 时间花在哪里。
+输出为 folded stacks 格式（"root;caller;callee 次数"），可直接交给 flamegraph.pl / speedscope 生成火焰图。
+
+慢请求捕获：设置 SLOW_REQUEST_THRESHOLD_MS 后，有请求在处理时采样器才运行，
+采样按固定时间窗口聚合计数，请求耗时超过阈值时合并其时间范围内的窗口保存；未设置时中间件只做一次判断，没有额外开销。
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter, deque
+from datetime import datetime
+from types import FrameType
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# 单个栈的最大深度，避免极深的递归栈占用过多内存
+MAX_STACK_DEPTH = 128
+
+# 慢请求采样线程名，按需采样时跳过该线程
+SAMPLER_THREAD_NAME = "slow-request-profiler"
+
+# 慢请求采样的聚合窗口（秒）：捕获的采样可能包含请求开始前最多一个窗口的内容
+SAMPLE_WINDOW_SECONDS = 0.5
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", os.path.basename(code.co_filename))
+    return f"{module}:{code.co_name}:{frame.f_lineno}"
+
+
+def _thread_stack(frame: Optional[FrameType]) -> List[str]:
+    """从最内层帧向外回溯，返回从根到叶的调用栈"""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def _task_stack(task: "asyncio.Task[Any]") -> List[str]:
+    """沿 await 链展开协程，返回从任务入口到当前挂起点的调用栈"""
+    labels = []
+    coro: Any = task.get_coro()
+    while coro is not None and len(labels) < MAX_STACK_DEPTH:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            break
+        labels.append(_frame_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+    return labels
+
+
+def sample_threads_once(skip_thread_id: Optional[int] = None) -> List[str]:
+    """对所有线程采样一次，返回 folded 格式的栈（每个线程一条）"""
+    names = {t.ident: t.name for t in threading.enumerate()}
+    stacks = []
+    for thread_id, frame in sys._current_frames().items():
+        if thread_id == skip_thread_id or names.get(thread_id) == SAMPLER_THREAD_NAME:
+            continue
+        stack = _thread_stack(frame)
+        if stack:
+            stacks.append(";".join([f"thread:{names.get(thread_id, thread_id)}"] + stack))
+    return stacks
+
+
+def sample_tasks_once() -> List[str]:
+    """对当前事件循环中的所有任务采样一次（必须在事件循环线程中调用）"""
+    current = asyncio.current_task()
+    stacks = []
+    for task in asyncio.all_tasks():
+        if task is current:
+            continue
+        stack = _task_stack(task)
+        if stack:
+            stacks.append(";".join([f"task:{task.get_name()}"] + stack))
+    return stacks
+
+
+def fold(counter: "Counter[str]") -> str:
+    """输出 folded stacks 文本，按次数降序"""
+    return "\n".join(f"{stack} {count}" for stack, count in counter.most_common()) + "\n"
+
+
+def profile_threads(seconds: float, interval: float) -> "Counter[str]":
+    """在调用线程中阻塞采样 seconds 秒（应在线程池中运行）"""
+    counter: Counter[str] = Counter()
+    me = threading.get_ident()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        counter.update(sample_threads_once(skip_thread_id=me))
+        time.sleep(interval)
+    return counter
+
+
+async def profile_tasks(seconds: float, interval: float) -> "Counter[str]":
+    """在事件循环上采样 asyncio 任务 seconds 秒"""
+    counter: Counter[str] = Counter()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + seconds
+    while loop.time() < deadline:
+        counter.update(sample_tasks_once())
+        await asyncio.sleep(interval)
+    return counter
+
+
+def dump_tasks() -> str:
+    """当前所有 asyncio 任务的即时快照（每个任务一行 folded 栈）"""
+    return fold(Counter(sample_tasks_once()))
+
+
+class SlowRequestProfiler:
+    """
+    慢请求采样捕获
+    有请求在处理时，后台线程采样事件循环线程、事件循环上的采样任务采样 asyncio 任务，
+    采样结果按 SAMPLE_WINDOW_SECONDS 聚合为每个窗口一个计数器，只保留最早的在途请求开始以来的窗口
+    （最多 max_seconds 秒），与并发请求数无关；请求结束时如果耗时超过阈值，合并其时间范围内的窗口保存。
+    并发请求的采样会出现在同一时间窗口中，分析时需结合路径判断。
+    """
+
+    def __init__(self, threshold_ms: Optional[float] = None, interval_ms: Optional[float] = None,
+                 keep: Optional[int] = None, max_seconds: Optional[float] = None):
+        if threshold_ms is None:
+            value = os.getenv("SLOW_REQUEST_THRESHOLD_MS")
+            threshold_ms = float(value) if value else None
+        self.threshold = threshold_ms / 1000 if threshold_ms else None
+        self.interval = (interval_ms or float(os.getenv("SLOW_REQUEST_SAMPLE_INTERVAL_MS", "10"))) / 1000
+        self.keep = keep or int(os.getenv("SLOW_REQUEST_KEEP", "20"))
+        self.max_seconds = max_seconds or float(os.getenv("SLOW_REQUEST_MAX_SECONDS", "300"))
+
+        # (窗口开始时间, 该窗口内各栈的采样次数)，采样线程和事件循环共同写入，由 _lock 保护
+        self._windows: Deque[Tuple[float, Counter[str]]] = deque(
+            maxlen=max(1, int(self.max_seconds / SAMPLE_WINDOW_SECONDS)))
+        self._lock = threading.Lock()
+        # 在途请求的开始时间，用于判断哪些窗口已不再需要
+        self._started: Counter[float] = Counter()
+        self._captured: Deque[Dict[str, Any]] = deque(maxlen=self.keep)
+        self._next_id = 1
+        self._in_flight = 0
+        self._active = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop_thread_id: Optional[int] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold is not None
+
+    def _record(self, stacks: List[str]) -> None:
+        with self._lock:
+            now = time.monotonic()
+            window = now - now % SAMPLE_WINDOW_SECONDS
+            if not self._windows or self._windows[-1][0] != window:
+                self._windows.append((window, Counter()))
+            self._windows[-1][1].update(stacks)
+
+    def _collect(self, started: float, finished: float) -> "Counter[str]":
+        """合并与 [started, finished] 重叠的窗口"""
+        counter: Counter[str] = Counter()
+        with self._lock:
+            for window, samples in reversed(self._windows):
+                if window + SAMPLE_WINDOW_SECONDS <= started:
+                    break
+                if window <= finished:
+                    counter.update(samples)
+        return counter
+
+    def _prune(self) -> None:
+        """丢弃在最早的在途请求开始之前结束的窗口"""
+        oldest = min(self._started) if self._started else time.monotonic()
+        with self._lock:
+            while self._windows and self._windows[0][0] + SAMPLE_WINDOW_SECONDS <= oldest:
+                self._windows.popleft()
+
+    def _thread_loop(self) -> None:
+        while True:
+            self._active.wait()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                stack = _thread_stack(frame)
+                if stack:
+                    self._record([";".join(["thread:event-loop"] + stack)])
+            time.sleep(self.interval)
+
+    async def _task_loop(self) -> None:
+        while self._in_flight > 0:
+            self._record(sample_tasks_once())
+            await asyncio.sleep(self.interval)
+        self._task = None
+
+    def begin(self) -> float:
+        """请求开始时调用，返回开始时间"""
+        self._in_flight += 1
+        if self._thread is None:
+            self._loop_thread_id = threading.get_ident()
+            self._thread = threading.Thread(target=self._thread_loop, name=SAMPLER_THREAD_NAME, daemon=True)
+            self._thread.start()
+        self._active.set()
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._task_loop(), name=SAMPLER_THREAD_NAME)
+        started = time.monotonic()
+        self._started[started] += 1
+        return started
+
+    def end(self, started: float, method: str, path: str) -> None:
+        """请求结束时调用；超过阈值则保存该请求时间窗口内的采样"""
+        self._in_flight -= 1
+        if self._in_flight <= 0:
+            self._in_flight = 0
+            self._active.clear()
+
+        finished = time.monotonic()
+        duration = finished - started
+        slow = self.threshold is not None and duration >= self.threshold
+        counter: Counter[str] = self._collect(started, finished) if slow else Counter()
+        self._started[started] -= 1
+        if self._started[started] <= 0:
+            del self._started[started]
+        self._prune()
+        if not slow:
+            return
+
+        record = {
+            "id": self._next_id,
+            "method": method,
+            "path": path,
+            "duration_ms": round(duration * 1000, 1),
+            "captured_at": datetime.now().isoformat(timespec="seconds"),
+            "samples": sum(counter.values()),
+            "folded": fold(counter),
+        }
+        self._next_id += 1
+        self._captured.append(record)
+        logger.warning(f"慢请求已捕获采样: {method} {path} 耗时 {record['duration_ms']}ms，profile id={record['id']}")
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [{k: v for k, v in r.items() if k != "folded"} for r in self._captured]
+
+    def get(self, profile_id: int) -> Optional[Dict[str, Any]]:
+        for record in self._captured:
+            if record["id"] == profile_id:
+                return record
+        return None
+
+
+slow_request_profiler = SlowRequestProfiler()
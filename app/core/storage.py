@@ -4,11 +4,14 @@ from typing import Optional
 
 from qcloud_cos import CosConfig, CosS3Client
 
+from .circuit_breaker import get_breaker
+
 # 存储桶信息（当前环境 iosapp01 已知）
 BUCKET_NAME = "696f-iosapp01-3gzwkfxgc5fa8d9e-1392987112"
 REGION = "ap-shanghai"
 
 _cos_client: Optional[CosS3Client] = None
+_cos_breaker = get_breaker("cos")
 
 
 def _get_cos_client() -> CosS3Client:
@@ -30,19 +33,26 @@ def _get_cos_client() -> CosS3Client:
 
 
 def upload_to_cos(file_content: bytes, file_name: str) -> str:
-    """上传文件到 COS，并返回可访问的 URL。"""
+    """
+    上传文件到 COS，并返回可访问的 URL。
+    COS 熔断时立即抛出 CircuitOpenError，不再等待超时。
+    """
     if not file_content:
         raise ValueError("文件内容为空")
 
     unique_key = f"uploads/{uuid.uuid4().hex}-{file_name}"
 
-    client = _get_cos_client()
-    client.put_object(
-        Bucket=BUCKET_NAME,
-        Body=file_content,
-        Key=unique_key,
+    _cos_breaker.call(
+        lambda: _get_cos_client().put_object(
+            Bucket=BUCKET_NAME,
+            Body=file_content,
+            Key=unique_key,
+        )
     )
 
     return f"https://{BUCKET_NAME}.cos.{REGION}.myqcloud.com/{unique_key}"
 
 
+def ping() -> None:
+    """检查存储桶可访问性（HEAD Bucket，供后台健康检查使用）"""
+    _get_cos_client().head_bucket(Bucket=BUCKET_NAME)
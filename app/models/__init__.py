@@ -1,5 +1,7 @@
 from .recipe import Recipe
+from .conversation import ConversationTurn
+from .deferred_job import DeferredJob
 from ..core.database import Base
 
 # 此文件将 'models' 文件夹声明为一个Python包 (package)，
-# 并将 Recipe 模型暴露出来，方便其他模块导入。
+# 并将 Recipe、ConversationTurn、DeferredJob 模型暴露出来，方便其他模块导入。
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, Text, TIMESTAMP, text
+from app.core.database import Base
+
+
+class ConversationTurn(Base):
+    # 会话历史表：每条记录是一轮对话的紧凑摘要，而不是原始请求/响应
+    __tablename__ = "conversation_turns"
+
+    id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(String(64), nullable=False, index=True)
+    # user / assistant
+    role = Column(String(16), nullable=False)
+    # 紧凑文本：图片轮次只记录引用，菜谱轮次只记录菜名和食材
+    content = Column(Text, nullable=False)
+    # 该轮生成或引用的菜谱ID（对应 recipes.id），图片不再重复发送给模型
+    recipe_id = Column(Integer, nullable=True)
+    token_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(TIMESTAMP, server_default=text('CURRENT_TIMESTAMP'))
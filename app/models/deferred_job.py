@@ -0,0 +1,29 @@
+from sqlalchemy import Column, DateTime, Integer, LargeBinary, String, Text, TIMESTAMP, text
+from sqlalchemy.dialects.mysql import MEDIUMBLOB
+from sqlalchemy.orm import deferred
+from app.core.database import Base
+
+
+class DeferredJob(Base):
+    # 延后任务表：依赖熔断期间无法完成的工作（稍后生成菜谱、稍后上传图片），进程重启后继续执行
+    __tablename__ = "deferred_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # recipe_generation / image_upload
+    kind = Column(String(32), nullable=False)
+    # pending / running / done / failed
+    status = Column(String(16), nullable=False, default='pending', index=True)
+    conversation_id = Column(String(64), nullable=True)
+    description = Column(Text, nullable=True)
+    file_name = Column(String(255), nullable=False, default='')
+    image_url = Column(String(1024), nullable=True)
+    # 尚待处理的图片内容；任务结束（完成或放弃）后清空。
+    # 延迟加载：查询任务状态时不读取图片，只有执行任务时访问该属性才加载
+    image_data = deferred(Column(LargeBinary().with_variant(MEDIUMBLOB(), "mysql"), nullable=True))
+    # 任务生成的菜谱，或待回填图片的菜谱（对应 recipes.id）
+    recipe_id = Column(Integer, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(String(512), nullable=True)
+    # 被某个实例认领执行的时间；认领后长时间未结束（例如进程崩溃）的任务会被重新执行
+    claimed_at = Column(DateTime, nullable=True)
+    created_at = Column(TIMESTAMP, server_default=text('CURRENT_TIMESTAMP'))
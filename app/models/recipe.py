@@ -16,3 +16,6 @@ class Recipe(Base):
     difficulty = Column(String(32), nullable=False, default='简单')
     # `server_default=text('CURRENT_TIMESTAMP')` 让数据库在创建记录时自动设置时间
     created_at = Column(TIMESTAMP, server_default=text('CURRENT_TIMESTAMP'))
+    # 菜谱内容（菜名、食材、步骤、时长、难度）的 SHA-256，批量导入时用于去重；
+    # 唯一索引保证并发导入也不会写入重复内容，内容重复的生成菜谱此列为空
+    content_hash = Column(String(64), nullable=True, index=True, unique=True)
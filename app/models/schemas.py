@@ -19,7 +19,7 @@ class TextQueryRequest(BaseModel):
     需求: 5.1 - 接受包含用户消息的JSON请求体
     """
     message: str = Field(..., min_length=1, max_length=1000, description="用户输入的文本消息")
-    conversation_id: Optional[str] = Field(None, description="会话ID，用于关联对话历史")
+    conversation_id: Optional[str] = Field(None, max_length=64, description="会话ID，用于关联对话历史")
     
     @validator('message')
     def message_not_empty(cls, v):
@@ -43,7 +43,7 @@ class ImageUploadRequest(BaseModel):
     需求: 5.2 - 接受multipart/form-data格式的图片文件
     注意: 实际的图片文件通过FastAPI的UploadFile处理，此模型用于元数据
     """
-    conversation_id: Optional[str] = Field(None, description="会话ID")
+    conversation_id: Optional[str] = Field(None, max_length=64, description="会话ID")
     description: Optional[str] = Field(None, max_length=500, description="图片描述或用户备注")
     
     class Config:
@@ -281,4 +281,20 @@ class RecipeSchema(RecipeDBBase):
 # 用于成功创建菜谱后的特定响应模型，继承自通用的APIResponse
 class RecipeCreationResponse(APIResponse[RecipeSchema]):
     """成功创建菜谱后的响应模型"""
+    conversation_id: Optional[str] = Field(None, description="会话ID，后续追问时传回以关联对话历史")
+    degraded: bool = Field(False, description="是否为上游依赖不可用时的降级响应（已有菜谱或稍后生成）")
+    job_id: Optional[int] = Field(None, description="稍后生成菜谱或稍后上传图片的任务ID，可通过 /api/chat/jobs/{job_id} 查询")
+
+
+class DeferredJobSchema(BaseModel):
+    """延后任务（稍后生成菜谱、稍后上传图片）的状态"""
+    job_id: int
+    kind: str = Field(..., description="任务类型：recipe_generation, image_upload")
+    status: str = Field(..., description="任务状态：pending, running, done, failed")
+    attempts: int = Field(0, description="已执行失败的次数")
+    recipe: Optional[RecipeSchema] = Field(None, description="任务生成（或回填了图片）的菜谱")
+
+
+class DeferredJobResponse(APIResponse[DeferredJobSchema]):
+    """延后任务查询响应"""
     pass
@@ -2,10 +2,18 @@
 服务层模块的入口
 此文件用于提供服务的单例实例，确保在整个应用中只有一个服务实例，以节省资源。
 """
-from typing import Optional
+from typing import Any, Dict, Optional
 from .qwen_vision_client import QwenVisionClient
+from .conversation import ConversationStore
+from .degraded import DeferredQueue, RecipeFallbackIndex
+from .health_monitor import HealthMonitor
+from app.core.circuit_breaker import breaker_states
 
 _vision_service_instance: Optional[QwenVisionClient] = None
+_conversation_store_instance: Optional[ConversationStore] = None
+_fallback_index_instance: Optional[RecipeFallbackIndex] = None
+_deferred_queue_instance: Optional[DeferredQueue] = None
+_health_monitor_instance: Optional[HealthMonitor] = None
 
 
 def get_vision_service() -> QwenVisionClient:
@@ -22,5 +30,75 @@ def get_vision_service() -> QwenVisionClient:
     return _vision_service_instance
 
 
-# 使 get_vision_service 可以从 app.services 导入
-__all__ = ["get_vision_service"]
+def get_conversation_store() -> ConversationStore:
+    """
+    获取ConversationStore会话存储单例
+
+    Returns:
+        ConversationStore: 会话存储实例
+    """
+    global _conversation_store_instance
+    if _conversation_store_instance is None:
+        _conversation_store_instance = ConversationStore()
+    return _conversation_store_instance
+
+
+def get_fallback_index() -> RecipeFallbackIndex:
+    """
+    获取降级菜谱索引单例
+
+    Returns:
+        RecipeFallbackIndex: 降级菜谱索引实例
+    """
+    global _fallback_index_instance
+    if _fallback_index_instance is None:
+        _fallback_index_instance = RecipeFallbackIndex()
+    return _fallback_index_instance
+
+
+def get_deferred_queue() -> DeferredQueue:
+    """
+    获取延后任务队列单例
+
+    Returns:
+        DeferredQueue: 延后任务队列实例
+    """
+    global _deferred_queue_instance
+    if _deferred_queue_instance is None:
+        _deferred_queue_instance = DeferredQueue()
+    return _deferred_queue_instance
+
+
+def get_health_monitor() -> HealthMonitor:
+    """
+    获取后台健康监控单例
+
+    Returns:
+        HealthMonitor: 健康监控实例
+    """
+    global _health_monitor_instance
+    if _health_monitor_instance is None:
+        _health_monitor_instance = HealthMonitor()
+    return _health_monitor_instance
+
+
+def collect_metrics() -> Dict[str, Any]:
+    """
+    汇总各服务的运行指标；尚未创建的服务不会因此被创建
+    """
+    return {
+        "vision": _vision_service_instance.metrics() if _vision_service_instance is not None else None,
+        "breakers": breaker_states(),
+        "deferred": _deferred_queue_instance.snapshot() if _deferred_queue_instance is not None else None,
+    }
+
+
+# 使各服务的获取函数和 collect_metrics 可以从 app.services 导入
+__all__ = [
+    "get_vision_service",
+    "get_conversation_store",
+    "get_fallback_index",
+    "get_deferred_queue",
+    "get_health_monitor",
+    "collect_metrics",
+]
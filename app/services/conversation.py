@@ -0,0 +1,298 @@
+"""
+会话记忆服务
+最近的对话轮次保存在内存中，较早的轮次写入数据库；
+构建上下文时在 token 预算内保留最近轮次，更早的轮次压缩为摘要或直接丢弃，
+使提示词长度（以及延迟和费用）不随对话变长而增长。
+"""
+import os
+import logging
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.database import db_breaker
+from app.models.conversation import ConversationTurn
+from app.models.schemas import Recipe
+
+
+logger = logging.getLogger(__name__)
+
+# 单条记录的最大字符数，超出部分截断
+MAX_TURN_CHARS = 300
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算 token 数：中日韩字符按 1 个 token 计，其余字符按 4 个字符 1 个 token 计。
+    不依赖分词器，足以用于预算控制。
+    """
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if "⺀" <= ch <= "鿿" or "豈" <= ch <= "﫿")
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
+
+
+def _truncate(text: str, limit: int = MAX_TURN_CHARS) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def summarize_recipe(recipe: Recipe, recipe_id: Optional[int] = None) -> str:
+    """将菜谱压缩为一行文本（菜名、食材、难度、时长），不包含步骤。"""
+    ingredients = "、".join(f"{i.name}{i.amount}{i.unit}" for i in recipe.ingredients)
+    ref = f"(#{recipe_id})" if recipe_id is not None else ""
+    return _truncate(
+        f"菜谱《{recipe.dish_name}》{ref}：食材 {ingredients}；{recipe.difficulty}，{recipe.cooking_time}分钟"
+    )
+
+
+@dataclass
+class TurnRecord:
+    """一轮对话的紧凑记录"""
+    role: str
+    content: str
+    recipe_id: Optional[int] = None
+    token_count: int = 0
+    db_id: Optional[int] = None
+
+    def to_message(self) -> Dict[str, Any]:
+        return {"role": self.role, "content": self.content}
+
+
+class _ConversationState:
+    def __init__(self, max_turns: int):
+        self.turns: Deque[TurnRecord] = deque(maxlen=max_turns)
+        # 是否存在已移出内存、只保存在数据库中的更早轮次
+        self.has_older: bool = False
+        # 是否已从数据库恢复历史；恢复失败（例如数据库熔断）时保持 False，下次访问时重试
+        self.loaded: bool = False
+
+
+class ConversationStore:
+    """
+    会话存储：内存中保留每个会话最近的若干轮，全部轮次写入数据库。
+    活跃会话数量有上限，按最近使用淘汰；被淘汰的会话下次访问时从数据库恢复。
+    """
+
+    def __init__(self, memory_turns: Optional[int] = None, max_conversations: Optional[int] = None,
+                 db_lookback: Optional[int] = None):
+        self.memory_turns = memory_turns or int(os.getenv("CONVERSATION_MEMORY_TURNS", "8"))
+        self.max_conversations = max_conversations or int(os.getenv("CONVERSATION_MAX_ACTIVE", "1000"))
+        self.db_lookback = db_lookback or int(os.getenv("CONVERSATION_DB_LOOKBACK", "40"))
+        self._conversations: "OrderedDict[str, _ConversationState]" = OrderedDict()
+
+    def _state(self, conversation_id: str, db: Optional[Session]) -> _ConversationState:
+        state = self._conversations.get(conversation_id)
+        if state is not None:
+            self._conversations.move_to_end(conversation_id)
+        else:
+            state = _ConversationState(self.memory_turns)
+            self._conversations[conversation_id] = state
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+
+        if not state.loaded and db is not None:
+            self._load(conversation_id, state, db)
+        return state
+
+    def _load(self, conversation_id: str, state: _ConversationState, db: Session) -> None:
+        """从数据库恢复最近的轮次；失败时保留内存中的轮次，下次访问时重试"""
+        try:
+            rows = db_breaker.call(
+                lambda: db.query(ConversationTurn)
+                .filter(ConversationTurn.conversation_id == conversation_id)
+                .order_by(ConversationTurn.id.desc())
+                .limit(self.memory_turns + 1)
+                .all()
+            )
+        except Exception as e:
+            logger.warning(f"从数据库恢复会话 {conversation_id} 失败，下次访问时重试: {e}")
+            return
+
+        # 恢复失败期间追加且未写入数据库的轮次排在数据库轮次之后
+        unsaved = [t for t in state.turns if t.db_id is None]
+        state.turns.clear()
+        for row in reversed(rows[:self.memory_turns]):
+            state.turns.append(self._from_row(row))
+        for turn in unsaved:
+            state.turns.append(turn)
+        state.has_older = len(rows) + len(unsaved) > self.memory_turns
+        state.loaded = True
+
+    @staticmethod
+    def _from_row(row: ConversationTurn) -> TurnRecord:
+        return TurnRecord(
+            role=row.role,
+            content=row.content,
+            recipe_id=row.recipe_id,
+            token_count=row.token_count or estimate_tokens(row.content),
+            db_id=row.id,
+        )
+
+    @staticmethod
+    def _insert(db: Session, row: ConversationTurn) -> None:
+        db.add(row)
+        db.commit()
+
+    def append(self, conversation_id: str, role: str, content: str,
+               recipe_id: Optional[int] = None, db: Optional[Session] = None) -> TurnRecord:
+        """追加一轮对话；数据库写入失败时只记录日志，不影响主流程。"""
+        content = _truncate(content)
+        record = TurnRecord(role=role, content=content, recipe_id=recipe_id,
+                            token_count=estimate_tokens(content))
+        state = self._state(conversation_id, db)
+
+        if db is not None:
+            try:
+                row = ConversationTurn(
+                    conversation_id=conversation_id,
+                    role=role,
+                    content=content,
+                    recipe_id=recipe_id,
+                    token_count=record.token_count,
+                )
+                db_breaker.call(self._insert, db, row)
+                record.db_id = row.id
+            except Exception as e:
+                logger.warning(f"会话轮次写入数据库失败: {e}")
+                db.rollback()
+
+        if len(state.turns) == state.turns.maxlen:
+            state.has_older = True
+        state.turns.append(record)
+        return record
+
+    def add_image_turn(self, conversation_id: str, recipe: Recipe, recipe_id: Optional[int],
+                       description: Optional[str] = None, db: Optional[Session] = None) -> None:
+        """
+        记录一次图片请求：用户轮次只保存对图片的引用，
+        后续对话通过已生成的菜谱来指代这张图片，而不是重新发送 base64 图片。
+        """
+        user_text = f"[上传了一张食材图片，已生成菜谱 #{recipe_id}]" if recipe_id is not None else "[上传了一张食材图片]"
+        if description:
+            user_text += f" {description}"
+        self.append(conversation_id, "user", user_text, recipe_id=recipe_id, db=db)
+        self.append(conversation_id, "assistant", summarize_recipe(recipe, recipe_id), recipe_id=recipe_id, db=db)
+
+    def add_text_turn(self, conversation_id: str, message: str, recipe: Recipe, recipe_id: Optional[int],
+                      db: Optional[Session] = None) -> None:
+        """记录一次文本请求及其生成的菜谱"""
+        self.append(conversation_id, "user", message, db=db)
+        self.append(conversation_id, "assistant", summarize_recipe(recipe, recipe_id), recipe_id=recipe_id, db=db)
+
+    def _has_newer_rows(self, conversation_id: str, state: _ConversationState, db: Session) -> bool:
+        """数据库中是否有内存里没有的更新轮次（例如由其他实例处理的请求写入）"""
+        last_id = max((t.db_id for t in state.turns if t.db_id is not None), default=0)
+        try:
+            row = db_breaker.call(
+                lambda: db.query(ConversationTurn.id)
+                .filter(ConversationTurn.conversation_id == conversation_id, ConversationTurn.id > last_id)
+                .first()
+            )
+        except Exception as e:
+            logger.warning(f"检查会话 {conversation_id} 的新轮次失败，使用内存中的轮次: {e}")
+            return False
+        return row is not None
+
+    def recent_turns(self, conversation_id: str, db: Optional[Session] = None) -> List[TurnRecord]:
+        state = self._state(conversation_id, db)
+        # 数据库是会话的权威来源：多实例部署时同一会话的请求可能落在不同实例上
+        if db is not None and state.loaded and self._has_newer_rows(conversation_id, state, db):
+            self._load(conversation_id, state, db)
+        return list(state.turns)
+
+    def older_turns(self, conversation_id: str, db: Optional[Session] = None) -> List[TurnRecord]:
+        """从数据库读取已移出内存的更早轮次（最多 db_lookback 条，按时间正序）"""
+        state = self._state(conversation_id, db)
+        # 会话尚未成功从数据库恢复时（_load 已记录原因）无法判断是否有更早的轮次，下次访问时重试
+        if db is None or not state.loaded or not state.has_older:
+            return []
+
+        ids = [t.db_id for t in state.turns if t.db_id is not None]
+        try:
+            query = db.query(ConversationTurn).filter(ConversationTurn.conversation_id == conversation_id)
+            if ids:
+                query = query.filter(ConversationTurn.id < min(ids))
+            rows = db_breaker.call(
+                lambda: query.order_by(ConversationTurn.id.desc()).limit(self.db_lookback).all()
+            )
+        except Exception as e:
+            logger.warning(f"读取会话 {conversation_id} 的历史轮次失败: {e}")
+            return []
+        return [self._from_row(row) for row in reversed(rows)]
+
+    def build_context(self, conversation_id: str, db: Optional[Session] = None,
+                      budget_tokens: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        在 token 预算内构建发送给模型的历史消息列表：
+        1. 从最新轮次往前，尽量原样保留；
+        2. 放不下的更早轮次压缩为一条摘要消息；
+        3. 摘要仍超出剩余预算时，从最旧的内容开始丢弃。
+        """
+        if budget_tokens is None:
+            budget_tokens = int(os.getenv("CONVERSATION_CONTEXT_TOKENS", "1500"))
+
+        recent = self.recent_turns(conversation_id, db)
+        kept: List[TurnRecord] = []
+        used = 0
+        for turn in reversed(recent):
+            if used + turn.token_count > budget_tokens:
+                break
+            kept.append(turn)
+            used += turn.token_count
+        kept.reverse()
+
+        dropped = recent[:len(recent) - len(kept)]
+        # 只有内存中的轮次全部放得下时才值得去数据库取更早的轮次
+        if not dropped:
+            dropped = self.older_turns(conversation_id, db)
+
+        messages = [t.to_message() for t in kept]
+        # 保证历史以用户消息开头，避免孤立的助手消息
+        while messages and messages[0]["role"] != "user":
+            turn = kept.pop(0)
+            messages.pop(0)
+            dropped.append(turn)
+            used -= turn.token_count
+
+        summary = _summarize_turns(dropped, budget_tokens - used)
+        if summary:
+            messages.insert(0, {"role": "system", "content": summary})
+        return messages
+
+    def forget(self, conversation_id: str) -> None:
+        """从内存中移除会话（数据库中的记录保留）"""
+        self._conversations.pop(conversation_id, None)
+
+
+def _summarize_turns(turns: List[TurnRecord], budget_tokens: int) -> str:
+    """
+    将较早的轮次抽取式压缩为一条摘要：保留用户的要求和生成过的菜名，
+    从最新往最旧填充，超出预算的部分丢弃。
+    """
+    prefix = "此前对话摘要："
+    budget_tokens -= estimate_tokens(prefix)
+    if not turns or budget_tokens <= 0:
+        return ""
+
+    parts: List[str] = []
+    used = 0
+    for turn in reversed(turns):
+        if turn.role == "assistant":
+            # 只保留菜名部分，例如 "菜谱《鱼香肉丝》(#12)"
+            piece = turn.content.split("：", 1)[0]
+        else:
+            piece = "用户：" + _truncate(turn.content, 60)
+        cost = estimate_tokens(piece) + 1
+        if used + cost > budget_tokens:
+            break
+        parts.append(piece)
+        used += cost
+
+    if not parts:
+        return ""
+    parts.reverse()
+    return prefix + "；".join(parts)
@@ -0,0 +1,306 @@
+"""
+降级服务
+上游依赖熔断时使用：
+- RecipeFallbackIndex：按食材名在已有菜谱中查找可替代的菜谱，模型不可用时快速返回；
+- DeferredQueue：把暂时无法完成的工作（延后生成菜谱、延后上传图片）持久化到数据库，
+  待对应依赖的熔断器恢复后在后台重试。
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+from app.core import database
+from app.core.circuit_breaker import get_breaker
+from app.core.database import db_breaker
+from app.models.deferred_job import DeferredJob
+from app.models.recipe import Recipe
+
+
+logger = logging.getLogger(__name__)
+
+
+class RecipeFallbackIndex:
+    """
+    已有菜谱的食材倒排索引（内存）
+    新菜谱保存时加入索引，首次查询时从数据库预热最近的菜谱。
+    """
+
+    def __init__(self, max_recipes: Optional[int] = None):
+        self.max_recipes = max_recipes or int(os.getenv("FALLBACK_INDEX_SIZE", "2000"))
+        self._recipes: "OrderedDict[int, Set[str]]" = OrderedDict()
+        self._warmed = False
+
+    def add(self, recipe_id: int, ingredient_names: Iterable[str]) -> None:
+        names = {n.strip() for n in ingredient_names if n and n.strip()}
+        if not names:
+            return
+        self._recipes[recipe_id] = names
+        self._recipes.move_to_end(recipe_id)
+        while len(self._recipes) > self.max_recipes:
+            self._recipes.popitem(last=False)
+
+    def warm(self, db: Session) -> None:
+        """从数据库加载最近的菜谱；数据库熔断时跳过，下次查询再试"""
+        if self._warmed or not db_breaker.allow():
+            return
+        try:
+            rows = db_breaker.call(
+                lambda: db.query(Recipe.id, Recipe.ingredients)
+                .order_by(Recipe.id.desc())
+                .limit(self.max_recipes)
+                .all()
+            )
+        except Exception as e:
+            logger.warning(f"预热降级菜谱索引失败: {e}")
+            return
+        for recipe_id, ingredients in reversed(rows):
+            try:
+                names = [item.get("name", "") for item in json.loads(ingredients or "[]")]
+            except (ValueError, AttributeError):
+                continue
+            if recipe_id not in self._recipes:
+                self.add(recipe_id, names)
+        self._warmed = True
+        logger.info(f"降级菜谱索引预热完成，共 {len(self._recipes)} 道菜谱")
+
+    def match(self, text: str) -> List[int]:
+        """返回食材名出现在 text 中的菜谱ID，按命中食材数、再按新旧排序"""
+        if not text:
+            return []
+        scored = []
+        for recipe_id, names in self._recipes.items():
+            hits = sum(1 for name in names if name in text)
+            if hits:
+                scored.append((hits, recipe_id))
+        scored.sort(reverse=True)
+        return [recipe_id for _, recipe_id in scored]
+
+    def find(self, db: Session, text: str) -> Optional[Recipe]:
+        """查找与 text 中食材最匹配的已有菜谱；找不到或数据库不可用时返回 None"""
+        self.warm(db)
+        ids = self.match(text)
+        if not ids:
+            return None
+        try:
+            return db_breaker.call(lambda: db.query(Recipe).filter(Recipe.id == ids[0]).first())
+        except Exception as e:
+            logger.warning(f"读取降级菜谱失败: {e}")
+            return None
+
+    def __len__(self) -> int:
+        return len(self._recipes)
+
+
+# 延后任务状态
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# 任务处理函数：在 db 会话中执行任务，可更新 job 的字段（例如 recipe_id），状态由队列维护
+JobHandler = Callable[[Session, DeferredJob], Awaitable[None]]
+
+
+class DeferredQueue:
+    """
+    延后任务队列
+    任务（包括待处理的图片）保存在 deferred_jobs 表中而不是进程内存中，进程重启后继续执行，
+    客户端可按任务ID查询进度和结果。后台循环定期取出待执行的任务，依赖的熔断器允许调用时执行；
+    失败的任务在达到最大尝试次数前保持待执行。
+    """
+
+    def __init__(self, maxsize: Optional[int] = None, interval: Optional[float] = None,
+                 max_attempts: Optional[int] = None, max_image_bytes: Optional[int] = None,
+                 stale_after: Optional[float] = None, rescan_interval: Optional[float] = None):
+        self.maxsize = maxsize or int(os.getenv("DEFERRED_QUEUE_SIZE", "100"))
+        self.interval = interval or float(os.getenv("DEFERRED_QUEUE_INTERVAL", "5"))
+        self.max_attempts = max_attempts or int(os.getenv("DEFERRED_MAX_ATTEMPTS", "5"))
+        self.max_image_bytes = max_image_bytes or int(os.getenv("DEFERRED_MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+        self.stale_after = stale_after or float(os.getenv("DEFERRED_STALE_SECONDS", "600"))
+        self.rescan_interval = rescan_interval or float(os.getenv("DEFERRED_RESCAN_SECONDS", "60"))
+        self._handlers: Dict[str, Tuple[str, JobHandler]] = {}
+        self._worker: Optional[asyncio.Task] = None
+        # 是否可能有待执行的任务：启动时为 True 以接手重启前留下的任务，
+        # 既没有待执行也没有执行中的任务时置为 False
+        self._has_pending = True
+        # 上次扫描的时间：即使 _has_pending 为 False 也每隔 rescan_interval 扫描一次，
+        # 以接手其他实例提交的任务和其他实例退出后留下的超时任务
+        self._last_scan = 0.0
+        self.pending: Dict[str, int] = {}
+        self.completed = 0
+        self.dropped = 0
+
+    def register(self, kind: str, dependency: str, handler: JobHandler) -> None:
+        """注册一类任务的处理函数；dependency 为其所依赖的熔断器名"""
+        get_breaker(dependency)
+        self._handlers[kind] = (dependency, handler)
+
+    def submit(self, db: Session, kind: str, **fields: Any) -> Optional[DeferredJob]:
+        """
+        把任务写入 deferred_jobs 表并返回；
+        队列已满、图片超过大小上限或数据库写入失败时返回 None
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"未注册的延后任务类型: {kind}")
+        image_data = fields.get("image_data")
+        if image_data is not None and len(image_data) > self.max_image_bytes:
+            logger.warning(f"图片大小 {len(image_data)} 字节超过延后任务上限 {self.max_image_bytes}，拒绝任务 {kind}")
+            return None
+
+        try:
+            job = db_breaker.call(self._insert, db, kind, fields)
+        except Exception as e:
+            logger.warning(f"延后任务 {kind} 写入数据库失败: {e}")
+            db.rollback()
+            return None
+        if job is None:
+            logger.warning(f"延后任务队列已满，拒绝任务 {kind}")
+            return None
+
+        self._has_pending = True
+        logger.info(f"任务 {kind} (#{job.id}) 已加入延后队列，等待依赖 {self._handlers[kind][0]} 恢复")
+        return job
+
+    def _insert(self, db: Session, kind: str, fields: Dict[str, Any]) -> Optional[DeferredJob]:
+        queued = (
+            db.query(func.count(DeferredJob.id))
+            .filter(DeferredJob.status.in_((PENDING, RUNNING)))
+            .scalar()
+        )
+        if queued >= self.maxsize:
+            return None
+        job = DeferredJob(kind=kind, status=PENDING, **fields)
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    def _runnable(self):
+        """待执行的任务：pending，或被认领后超过 stale_after 仍未结束（例如执行它的进程已退出）"""
+        stale = datetime.now() - timedelta(seconds=self.stale_after)
+        return or_(
+            DeferredJob.status == PENDING,
+            and_(DeferredJob.status == RUNNING, DeferredJob.claimed_at < stale),
+        )
+
+    def _claim(self, db: Session, job_id: int) -> bool:
+        # 条件更新认领任务：多个实例共用同一张表时，每个任务只由一个实例执行
+        claimed = (
+            db.query(DeferredJob)
+            .filter(DeferredJob.id == job_id, self._runnable())
+            .update({"status": RUNNING, "claimed_at": datetime.now()}, synchronize_session=False)
+        )
+        db.commit()
+        return claimed == 1
+
+    async def drain_once(self) -> None:
+        rescan_due = time.monotonic() - self._last_scan >= self.rescan_interval
+        if not (self._has_pending or rescan_due) or not db_breaker.allow():
+            return
+        self._last_scan = time.monotonic()
+
+        try:
+            db = database.get_session_local()()
+        except RuntimeError as e:
+            # 数据库未配置（例如本地开发）：没有可执行的任务
+            logger.info(f"延后任务队列未启用: {e}")
+            self._has_pending = False
+            return
+        try:
+            jobs = db_breaker.call(
+                lambda: db.query(DeferredJob.id, DeferredJob.kind)
+                .filter(self._runnable())
+                .order_by(DeferredJob.id)
+                .limit(self.maxsize)
+                .all()
+            )
+            pending: Dict[str, int] = {}
+            for _, kind in jobs:
+                pending[kind] = pending.get(kind, 0) + 1
+            self.pending = pending
+            if not jobs:
+                # 仍有执行中的任务时保持扫描：执行它的进程可能已退出，超时后需要由本实例接手
+                self._has_pending = db_breaker.call(
+                    lambda: db.query(DeferredJob.id).filter(DeferredJob.status == RUNNING).first() is not None
+                )
+                return
+
+            for job_id, kind in jobs:
+                if kind not in self._handlers:
+                    continue
+                dependency, handler = self._handlers[kind]
+                if not get_breaker(dependency).allow() or not db_breaker.allow():
+                    continue
+                if db_breaker.call(self._claim, db, job_id):
+                    await self._run(db, job_id, kind, handler)
+        finally:
+            db.close()
+
+    async def _run(self, db: Session, job_id: int, kind: str, handler: JobHandler) -> None:
+        job = db.get(DeferredJob, job_id)
+        try:
+            await handler(db, job)
+        except Exception as e:
+            db.rollback()
+            job.attempts += 1
+            job.error = str(e)[:512]
+            if job.attempts >= self.max_attempts:
+                job.status = FAILED
+                job.image_data = None
+                self.dropped += 1
+                logger.error(f"延后任务 {kind} (#{job_id}) 重试 {job.attempts} 次后放弃: {e}")
+            else:
+                job.status = PENDING
+                logger.warning(f"延后任务 {kind} (#{job_id}) 第 {job.attempts} 次执行失败: {e}")
+            db_breaker.call(db.commit)
+            if job.status == FAILED:
+                self._finished(kind)
+            return
+
+        job.status = DONE
+        job.image_data = None
+        job.error = None
+        db_breaker.call(db.commit)
+        self.completed += 1
+        self._finished(kind)
+        logger.info(f"延后任务 {kind} (#{job_id}) 执行成功")
+
+    def _finished(self, kind: str) -> None:
+        if self.pending.get(kind, 0) > 0:
+            self.pending[kind] -= 1
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.drain_once()
+            except Exception as e:
+                logger.error(f"延后任务队列处理出错: {e}", exc_info=True)
+
+    def start(self) -> None:
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "pending": self.pending,
+            "completed": self.completed,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,173 @@
+"""
+后台健康监控
+按固定间隔在后台探测数据库、COS 和模型接口，缓存每个组件的状态、检查时间和延迟。
+/livez、/readyz 和 /api/chat/health 直接读取缓存，不在请求路径上创建客户端或访问依赖，
+服务繁忙时探针也能立即返回。
+"""
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core import database
+from app.core.circuit_breaker import breaker_states
+
+
+logger = logging.getLogger(__name__)
+
+HEALTHY = "healthy"
+UNHEALTHY = "unhealthy"
+NOT_CONFIGURED = "not_configured"
+PENDING = "pending"
+
+# 不可用时服务无法提供任何结果的依赖；其余依赖不可用时服务以降级模式继续就绪
+CRITICAL_COMPONENTS = ("database",)
+
+
+async def _probe_database() -> Optional[str]:
+    if not database.is_db_configured():
+        return NOT_CONFIGURED
+    await run_in_threadpool(database.ping)
+    return None
+
+
+async def _probe_cos() -> Optional[str]:
+    if not (os.getenv("TENCENTCLOUD_SECRETID") and os.getenv("TENCENTCLOUD_SECRETKEY")):
+        return NOT_CONFIGURED
+    from app.core import storage
+    await run_in_threadpool(storage.ping)
+    return None
+
+
+async def _probe_model() -> Optional[str]:
+    if not os.getenv("DASHSCOPE_API_KEY"):
+        return NOT_CONFIGURED
+    from app.services import get_vision_service
+    await get_vision_service().ping()
+    return None
+
+
+DEFAULT_PROBES: Dict[str, Callable[[], Awaitable[Optional[str]]]] = {
+    "database": _probe_database,
+    "cos": _probe_cos,
+    "qwen_vision_service": _probe_model,
+}
+
+
+class HealthMonitor:
+    """
+    后台健康监控器
+    每个探针返回 None 表示健康、返回 NOT_CONFIGURED 表示未配置，抛出异常或超时表示不健康。
+    """
+
+    def __init__(self, probes: Optional[Dict[str, Callable[[], Awaitable[Optional[str]]]]] = None,
+                 interval: Optional[float] = None, timeout: Optional[float] = None,
+                 max_pool_saturation: Optional[float] = None):
+        self.probes = probes if probes is not None else dict(DEFAULT_PROBES)
+        self.interval = interval or float(os.getenv("HEALTH_CHECK_INTERVAL", "15"))
+        self.timeout = timeout or float(os.getenv("HEALTH_PROBE_TIMEOUT", "5"))
+        self.max_pool_saturation = max_pool_saturation or float(os.getenv("READY_MAX_POOL_SATURATION", "0.9"))
+        self.started_at = time.monotonic()
+        self.last_run: Optional[float] = None
+        self.results: Dict[str, Dict[str, Any]] = {
+            name: {"status": PENDING, "checked_at": None, "latency_ms": None, "error": None}
+            for name in self.probes
+        }
+        self._worker: Optional[asyncio.Task] = None
+
+    async def _run_probe(self, name: str, probe: Callable[[], Awaitable[Optional[str]]]) -> None:
+        start = time.perf_counter()
+        try:
+            outcome = await asyncio.wait_for(probe(), timeout=self.timeout)
+            status, error = (outcome or HEALTHY), None
+        except asyncio.TimeoutError:
+            status, error = UNHEALTHY, f"探测超时（{self.timeout:.0f}s）"
+        except Exception as e:
+            status, error = UNHEALTHY, str(e)
+
+        if status == UNHEALTHY and self.results[name]["status"] != UNHEALTHY:
+            logger.warning(f"健康检查: 组件 {name} 不健康: {error}")
+        self.results[name] = {
+            "status": status,
+            "checked_at": datetime.now().isoformat(timespec="seconds"),
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            "error": error,
+        }
+
+    async def check_once(self) -> None:
+        await asyncio.gather(*(self._run_probe(name, probe) for name, probe in self.probes.items()))
+        self.last_run = time.monotonic()
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.check_once()
+            except Exception as e:
+                logger.error(f"后台健康检查出错: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    def is_stale(self) -> bool:
+        """最近一次检查距今超过 3 个间隔，说明后台检查已停滞"""
+        return self.last_run is None or time.monotonic() - self.last_run > 3 * self.interval
+
+    def liveness(self) -> Dict[str, Any]:
+        return {
+            "status": "alive",
+            "uptime_seconds": round(time.monotonic() - self.started_at, 1),
+            "last_check_age_seconds": round(time.monotonic() - self.last_run, 1) if self.last_run else None,
+        }
+
+    def readiness(self) -> Dict[str, Any]:
+        """
+        就绪状态：关键依赖健康、数据库熔断器未打开且连接池未饱和时就绪；
+        非关键依赖不健康或熔断时仍然就绪，但标记为 degraded。
+        """
+        reasons = []
+        if self.last_run is None:
+            reasons.append("尚未完成首次健康检查")
+        elif self.is_stale():
+            reasons.append("后台健康检查已停滞")
+
+        for name in CRITICAL_COMPONENTS:
+            status = self.results.get(name, {}).get("status")
+            if status in (UNHEALTHY, NOT_CONFIGURED):
+                reasons.append(f"{name} {'未配置' if status == NOT_CONFIGURED else '不健康'}")
+
+        breakers = breaker_states()
+        for name in CRITICAL_COMPONENTS:
+            if breakers.get(name, {}).get("state") == "open":
+                reasons.append(f"{name} 熔断器已打开")
+
+        pool = database.pool_status()
+        if pool is not None and pool["saturation"] >= self.max_pool_saturation:
+            reasons.append(f"数据库连接池饱和（{pool['checked_out']}/{pool['capacity']}）")
+
+        degraded = any(
+            r["status"] == UNHEALTHY for n, r in self.results.items() if n not in CRITICAL_COMPONENTS
+        ) or any(b["state"] != "closed" for b in breakers.values())
+
+        return {
+            "ready": not reasons,
+            "degraded": degraded,
+            "reasons": reasons,
+            "components": self.results,
+            "breakers": breakers,
+            "pool": pool,
+        }
@@ -0,0 +1,139 @@
+"""
+对冲请求 (hedged requests)
+首个请求在自适应延迟（近期延迟的某个分位数）内没有返回时，再发送一个相同的请求，
+取先成功返回的结果并取消另一个，用少量额外调用削减上游的长尾延迟。
+对冲数量受预算限制，只占总流量的一小部分。
+"""
+import os
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class HedgeConfig:
+    """对冲策略配置"""
+    # 触发对冲的延迟分位数
+    percentile: float = 0.95
+    # 对冲请求占总请求的比例上限
+    budget: float = 0.05
+    # 对冲延迟的下限/上限（秒）
+    min_delay: float = 0.5
+    max_delay: float = 30.0
+    # 样本不足时不对冲
+    min_samples: int = 20
+    window: int = 500
+
+
+def load_hedge_config_from_env() -> Optional[HedgeConfig]:
+    """
+    读取对冲配置；QWEN_HEDGE_ENABLED 未开启时返回 None（默认关闭）。
+    """
+    if os.getenv("QWEN_HEDGE_ENABLED", "false").lower() not in ("1", "true", "yes"):
+        return None
+    return HedgeConfig(
+        percentile=float(os.getenv("QWEN_HEDGE_PERCENTILE", "0.95")),
+        budget=float(os.getenv("QWEN_HEDGE_BUDGET", "0.05")),
+        min_delay=float(os.getenv("QWEN_HEDGE_MIN_DELAY", "0.5")),
+        max_delay=float(os.getenv("QWEN_HEDGE_MAX_DELAY", "30")),
+    )
+
+
+class HedgePolicy:
+    """
+    单个上游（模型档位）的对冲策略：
+    根据近期延迟计算对冲延迟，并用令牌桶限制对冲比例——
+    每个请求积累 budget 个令牌，每次对冲消耗 1 个。
+    """
+
+    def __init__(self, config: HedgeConfig):
+        self.config = config
+        self.latencies: Deque[float] = deque(maxlen=config.window)
+        self._tokens = 0.0
+        # 令牌上限，避免长时间空闲后出现一波集中对冲
+        self._max_tokens = max(1.0, config.budget * 100)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record_latency(self, seconds: float) -> None:
+        self.latencies.append(seconds)
+
+    def delay(self) -> Optional[float]:
+        """当前对冲延迟；样本不足时返回 None 表示不对冲"""
+        if len(self.latencies) < self.config.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(self.config.percentile * (len(ordered) - 1)))
+        return min(max(ordered[index], self.config.min_delay), self.config.max_delay)
+
+    def on_request(self) -> None:
+        self.requests += 1
+        self._tokens = min(self._max_tokens, self._tokens + self.config.budget)
+
+    def try_acquire(self) -> bool:
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            self.hedges += 1
+            return True
+        return False
+
+    def snapshot(self) -> Dict[str, Any]:
+        delay = self.delay()
+        return {
+            "hedge_delay": round(delay, 4) if delay is not None else None,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_rate": round(self.hedges / self.requests, 4) if self.requests else 0.0,
+        }
+
+
+async def hedged_call(policy: HedgePolicy, call: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    以对冲方式执行 call：首个请求超过对冲延迟仍未返回且预算允许时，发出第二个请求，
+    返回先成功的结果并取消另一个；两个都失败时抛出最后一个异常。
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    policy.on_request()
+
+    primary = asyncio.ensure_future(call())
+    tasks = [primary]
+    try:
+        delay = policy.delay()
+        if delay is not None:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+        if delay is None or done or not policy.try_acquire():
+            result = await primary
+            policy.record_latency(loop.time() - start)
+            return result
+
+        logger.info(f"上游请求超过对冲延迟 {delay:.2f}s 未返回，发送对冲请求")
+        hedge = asyncio.ensure_future(call())
+        tasks.append(hedge)
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        policy.hedge_wins += 1
+                    policy.record_latency(loop.time() - start)
+                    return task.result()
+                error = task.exception()
+        assert error is not None
+        raise error
+    finally:
+        # 取消落后的请求（以及调用方被取消时仍在进行的请求）
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                # 标记落败请求的异常已被处理，避免 "exception was never retrieved" 警告
+                task.exception()
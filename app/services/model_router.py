@@ -0,0 +1,210 @@
+"""
+模型路由（级联）
+按配置顺序依次尝试各档模型：先用快速、便宜的视觉模型，
+输出无法通过校验或置信度不足时再升级到更大的模型。
+每一档的延迟、升级率和 token 消耗都会被记录，便于根据真实流量调整级联配置。
+开启对冲时，每档调用都经过对冲策略以削减长尾延迟。
+"""
+import os
+import time
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from openai import AsyncOpenAI
+
+from .hedging import HedgeConfig, HedgePolicy, hedged_call
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+
+# 未配置时的默认级联：快速档 -> 完整档
+DEFAULT_TIERS: Dict[str, Dict[str, Any]] = {
+    "fast": {"model": "qwen3-vl-flash", "timeout": 20.0},
+    "full": {"model": "qwen3-vl-plus", "timeout": 60.0},
+}
+
+# 每档保留的最近延迟样本数，用于计算分位数
+LATENCY_WINDOW = 500
+
+
+@dataclass
+class ModelTier:
+    """一档模型的配置"""
+    name: str
+    model: str
+    base_url: str
+    timeout: float
+    api_key: str
+    # 低于该置信度时升级到下一档（最后一档忽略此值）
+    min_confidence: float = 0.6
+
+
+def load_tiers_from_env(default_api_key: str) -> List[ModelTier]:
+    """
+    从环境变量读取级联配置：
+    QWEN_CASCADE_TIERS=fast,full 指定档位顺序，每档可通过
+    QWEN_<TIER>_MODEL / QWEN_<TIER>_TIMEOUT / QWEN_<TIER>_BASE_URL / QWEN_<TIER>_API_KEY
+    / QWEN_<TIER>_MIN_CONFIDENCE 单独覆盖。
+    """
+    names = [n.strip() for n in os.getenv("QWEN_CASCADE_TIERS", "fast,full").split(",") if n.strip()]
+    if not names:
+        raise ValueError("QWEN_CASCADE_TIERS 至少需要配置一档模型")
+
+    tiers = []
+    for name in names:
+        prefix = f"QWEN_{name.upper()}_"
+        defaults = DEFAULT_TIERS.get(name, {})
+        model = os.getenv(prefix + "MODEL") or defaults.get("model")
+        if not model:
+            raise ValueError(f"模型档位 {name} 未配置 {prefix}MODEL")
+        tiers.append(ModelTier(
+            name=name,
+            model=model,
+            base_url=os.getenv(prefix + "BASE_URL") or DEFAULT_BASE_URL,
+            timeout=float(os.getenv(prefix + "TIMEOUT") or defaults.get("timeout", 60.0)),
+            api_key=os.getenv(prefix + "API_KEY") or default_api_key,
+            min_confidence=float(os.getenv(prefix + "MIN_CONFIDENCE") or 0.6),
+        ))
+    return tiers
+
+
+def _percentile(samples: List[float], q: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return round(ordered[index], 4)
+
+
+class TierStats:
+    """单档模型的运行统计"""
+
+    def __init__(self):
+        self.calls = 0
+        self.accepted = 0
+        self.escalations = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def snapshot(self) -> Dict[str, Any]:
+        samples = list(self.latencies)
+        return {
+            "calls": self.calls,
+            "accepted": self.accepted,
+            "escalations": self.escalations,
+            "errors": self.errors,
+            "escalation_rate": round(self.escalations / self.calls, 4) if self.calls else 0.0,
+            "latency_p50": _percentile(samples, 0.5),
+            "latency_p95": _percentile(samples, 0.95),
+            "latency_p99": _percentile(samples, 0.99),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+        }
+
+
+class ModelCascade:
+    """
+    模型级联执行器
+    parse 负责把模型输出解析为结果对象，解析或校验失败时抛出 ValueError；
+    confidence 返回 0~1 的置信度，低于当前档位阈值时升级。
+    hedge 不为 None 时，每档各自维护一个对冲策略。
+    """
+
+    def __init__(self, tiers: List[ModelTier], client_factory: Callable[..., Any] = AsyncOpenAI,
+                 hedge: Optional[HedgeConfig] = None):
+        if not tiers:
+            raise ValueError("模型级联至少需要一档模型")
+        self.tiers = tiers
+        self.clients: Dict[str, Any] = {}
+        self.stats: Dict[str, TierStats] = {}
+        self.hedges: Dict[str, HedgePolicy] = {}
+        for i, tier in enumerate(tiers):
+            is_last = i == len(tiers) - 1
+            # 非最后一档不做 SDK 内部重试：失败直接升级，升级本身就是重试
+            self.clients[tier.name] = client_factory(
+                api_key=tier.api_key,
+                base_url=tier.base_url,
+                timeout=tier.timeout,
+                **({} if is_last else {"max_retries": 0}),
+            )
+            self.stats[tier.name] = TierStats()
+            if hedge is not None:
+                self.hedges[tier.name] = HedgePolicy(hedge)
+
+    async def _call(self, tier: ModelTier, messages: List[Dict[str, Any]]) -> Any:
+        async def call() -> Any:
+            return await self.clients[tier.name].chat.completions.create(
+                model=tier.model,
+                messages=messages,
+            )
+
+        policy = self.hedges.get(tier.name)
+        if policy is None:
+            return await call()
+        return await hedged_call(policy, call)
+
+    async def complete(
+        self,
+        messages: List[Dict[str, Any]],
+        parse: Callable[[str], Any],
+        confidence: Optional[Callable[[Any, Optional[str]], float]] = None,
+    ) -> Tuple[Any, str]:
+        """
+        依次尝试各档模型，返回 (解析结果, 命中的档位名)。
+        最后一档的异常原样抛出。
+        """
+        last_index = len(self.tiers) - 1
+        for i, tier in enumerate(self.tiers):
+            stats = self.stats[tier.name]
+            stats.calls += 1
+            is_last = i == last_index
+            start = time.perf_counter()
+            try:
+                try:
+                    completion = await self._call(tier, messages)
+                finally:
+                    # 失败（包括超时）的调用同样计入延迟，便于调整各档超时
+                    stats.latencies.append(time.perf_counter() - start)
+
+                usage = getattr(completion, "usage", None)
+                if usage is not None:
+                    stats.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+                    stats.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+
+                choice = completion.choices[0]
+                result = parse(choice.message.content or "")
+            except Exception as e:
+                stats.errors += 1
+                if is_last:
+                    raise
+                stats.escalations += 1
+                logger.warning(f"模型档位 {tier.name} ({tier.model}) 失败，升级到下一档: {e}")
+                continue
+
+            if confidence is not None and not is_last:
+                score = confidence(result, getattr(choice, "finish_reason", None))
+                if score < tier.min_confidence:
+                    stats.escalations += 1
+                    logger.info(f"模型档位 {tier.name} 置信度 {score:.2f} 低于阈值 {tier.min_confidence}，升级")
+                    continue
+
+            stats.accepted += 1
+            return result, tier.name
+
+        # 理论上不会到达：最后一档要么返回要么抛出
+        raise RuntimeError("模型级联未返回结果")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """各档统计快照，供 metrics 端点使用"""
+        snapshot = {}
+        for tier in self.tiers:
+            snapshot[tier.name] = {"model": tier.model, **self.stats[tier.name].snapshot()}
+            if tier.name in self.hedges:
+                snapshot[tier.name].update(self.hedges[tier.name].snapshot())
+        return snapshot
@@ -1,16 +1,40 @@
 """
 通义千问视觉API客户端 (OpenAI-compatible)
-使用 qwen-vl-plus 模型一步到位，从图片直接生成结构化的菜谱JSON
+通过模型级联一步到位，从图片直接生成结构化的菜谱JSON：
+先使用快速模型，输出不合格时升级到 qwen3-vl-plus
 """
 import os
 import logging
 import base64
 import json
+from typing import Any, Dict, List, Optional
 
-from openai import OpenAI
+from openai import APIStatusError
 from pydantic import ValidationError
 
+from app.core.circuit_breaker import CircuitOpenError, get_breaker
 from app.models.schemas import Recipe
+from .model_router import ModelCascade, load_tiers_from_env
+from .hedging import load_hedge_config_from_env
+
+
+RECIPE_JSON_FORMAT = """以严格的JSON格式返回这道菜的菜谱。JSON对象必须包含以下字段：
+   - "dish_name": "菜品名称" (字符串)
+   - "ingredients": [{"name": "食材名", "amount": "用量", "unit": "单位"}, ...] (对象数组)
+   - "steps": [{"step_number": 1, "description": "步骤描述", "duration": 分钟数}, ...] (对象数组)
+   - "cooking_time": 总烹饪时间 (整数, 分钟)
+   - "difficulty": "难度" (字符串, 例如：简单, 中等, 困难)
+
+请确保返回的只有纯粹的、不含任何额外解释和Markdown标记的JSON字符串。
+"""
+
+IMAGE_RECIPE_PROMPT = """你是一位经验丰富的美食家和厨师。请根据这张图片，完成以下任务：
+1. 识别图片中的主要食材。
+2. 围绕这些食材，构思一道美味、有创意的菜肴。
+3. """ + RECIPE_JSON_FORMAT
+
+TEXT_RECIPE_PROMPT = """你是一位经验丰富的美食家和厨师。请结合之前的对话（如果有）和用户的最新要求，
+给出一道菜（或对之前菜谱的调整），并""" + RECIPE_JSON_FORMAT
 
 
 logger = logging.getLogger(__name__)
@@ -28,85 +52,151 @@ class QwenVisionClient:
             raise ValueError("DASHSCOPE_API_KEY 环境变量未设置!")
 
         try:
-            self.client: OpenAI = OpenAI(
-                api_key=self.api_key,
-                base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+            self.cascade: ModelCascade = ModelCascade(
+                load_tiers_from_env(self.api_key),
+                hedge=load_hedge_config_from_env(),
             )
-            logger.info("QwenVisionClient (OpenAI-compatible) 初始化成功。")
+            tiers = " -> ".join(f"{t.name}:{t.model}" for t in self.cascade.tiers)
+            self.breaker = get_breaker("model")
+            hedging = "开启" if self.cascade.hedges else "关闭"
+            logger.info(f"QwenVisionClient (OpenAI-compatible) 初始化成功，模型级联: {tiers}，对冲请求: {hedging}")
         except Exception as e:
             logger.error(f"OpenAI 客户端初始化失败: {e}", exc_info=True)
             raise
 
-    async def generate_recipe_from_image(self, image_bytes: bytes) -> Recipe:
+    async def generate_recipe_from_image(
+        self,
+        image_bytes: bytes,
+        history: Optional[List[Dict[str, Any]]] = None,
+        description: Optional[str] = None,
+    ) -> Recipe:
         """
-        接收图片，调用qwen3-vl-plus模型，返回结构化的菜谱对象
+        接收图片，经模型级联生成结构化的菜谱对象
+        history 为会话记忆构建的历史消息（纯文本，不包含图片）
         """
         if not image_bytes:
             raise ValueError("图片数据不能为空")
 
-        logger.info("使用 qwen3-vl-plus 模型生成完整菜谱...")
+        logger.info("使用模型级联从图片生成完整菜谱...")
         base64_image = base64.b64encode(image_bytes).decode("utf-8")
         image_url = f"data:image/jpeg;base64,{base64_image}"
 
-        prompt = """你是一位经验丰富的美食家和厨师。请根据这张图片，完成以下任务：
-1. 识别图片中的主要食材。
-2. 围绕这些食材，构思一道美味、有创意的菜肴。
-3. 以严格的JSON格式返回这道菜的菜谱。JSON对象必须包含以下字段：
-   - "dish_name": "菜品名称" (字符串)
-   - "ingredients": [{"name": "食材名", "amount": "用量", "unit": "单位"}, ...] (对象数组)
-   - "steps": [{"step_number": 1, "description": "步骤描述", "duration": 分钟数}, ...] (对象数组)
-   - "cooking_time": 总烹饪时间 (整数, 分钟)
-   - "difficulty": "难度" (字符串, 例如：简单, 中等, 困难)
-
-请确保返回的只有纯粹的、不含任何额外解释和Markdown标记的JSON字符串。
-"""
+        prompt = IMAGE_RECIPE_PROMPT
+        if description:
+            prompt += f"\n用户补充说明：{description}\n"
 
-        response_content: str = ""
-        try:
-            completion = self.client.chat.completions.create(
-                model="qwen3-vl-plus",
-                messages=[
+        messages = list(history or []) + [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
                     {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": image_url
-                                },
-                            },
-                        ],
+                        "type": "image_url",
+                        "image_url": {
+                            "url": image_url
+                        },
                     },
                 ],
+            },
+        ]
+        return await self._complete_recipe(messages)
+
+    async def generate_recipe_from_text(
+        self,
+        message: str,
+        history: Optional[List[Dict[str, Any]]] = None,
+    ) -> Recipe:
+        """
+        根据文本消息（通常是对之前菜谱的追问，例如“做得不那么辣”）生成菜谱
+        """
+        if not message or not message.strip():
+            raise ValueError("消息内容不能为空")
+
+        logger.info("使用模型级联根据文本生成菜谱...")
+        history = list(history or [])
+        # 只发送一条 system 消息：历史开头的摘要并入菜谱提示词
+        system_parts = [TEXT_RECIPE_PROMPT]
+        while history and history[0]["role"] == "system":
+            system_parts.append(history.pop(0)["content"])
+        messages = [{"role": "system", "content": "\n\n".join(system_parts)}]
+        messages += history
+        messages.append({"role": "user", "content": message})
+        return await self._complete_recipe(messages)
+
+    async def _complete_recipe(self, messages: List[Dict[str, Any]]) -> Recipe:
+        """
+        经模型级联调用模型，并将返回内容解析、校验为 Recipe
+        模型熔断时立即抛出 CircuitOpenError
+        """
+        try:
+            recipe, tier = await self.breaker.call_async(
+                self.cascade.complete, messages, _parse_recipe, _recipe_confidence
             )
-
-            response_content = completion.choices[0].message.content or ""
-            if not response_content.strip():
-                raise ValueError("模型未返回有效文本内容")
-
-            logger.info(f"API 成功响应，内容长度: {len(response_content)}")
-
-            recipe_data = json.loads(response_content)
-
-            # 使用Pydantic模型进行验证和转换，确保数据结构正确
-            recipe = Recipe.model_validate(recipe_data)
-
-            logger.info(f"成功生成并解析菜谱: {recipe.dish_name}")
+            logger.info(f"成功生成并解析菜谱: {recipe.dish_name} (模型档位: {tier})")
             return recipe
-
-        except json.JSONDecodeError as e:
-            logger.error(f"解析AI返回的JSON时失败: {e}", exc_info=True)
-            logger.error(f"错误的JSON内容: {response_content}")
-            raise ValueError("AI模型返回的菜谱格式无效，无法解析。")
-        except ValidationError as e:
-            logger.error(f"AI返回的JSON结构不符合预期的菜谱格式: {e}", exc_info=True)
-            raise ValueError("AI模型返回的数据结构不正确。")
+        except (ValueError, CircuitOpenError):
+            raise
         except Exception as e:
             logger.error(f"调用通义千问API或解析响应时出错: {e}", exc_info=True)
             raise
 
+    async def ping(self) -> None:
+        """
+        检查各档模型接口的连通性（GET /models，不消耗 token，供后台健康检查使用）
+        接口返回 404/405 等客户端错误说明服务可达，只有认证失败、服务端错误和网络错误视为不健康。
+        """
+        for client in self.cascade.clients.values():
+            try:
+                await client.models.list()
+            except APIStatusError as e:
+                if e.status_code in (401, 403) or e.status_code >= 500:
+                    raise
+
+    def metrics(self) -> Dict[str, Any]:
+        """模型级联各档位的延迟、升级率和 token 消耗"""
+        return {"cascade": self.cascade.snapshot()}
+
     async def close(self):
+        for client in self.cascade.clients.values():
+            await client.close()
         logger.info("QwenVisionClient closed.")
-        pass
 
+
+def _parse_recipe(response_content: str) -> Recipe:
+    """解析并校验模型返回的菜谱JSON，失败时抛出 ValueError"""
+    if not response_content.strip():
+        raise ValueError("模型未返回有效文本内容")
+
+    logger.info(f"API 成功响应，内容长度: {len(response_content)}")
+    try:
+        recipe_data = json.loads(response_content)
+        # 使用Pydantic模型进行验证和转换，确保数据结构正确
+        return Recipe.model_validate(recipe_data)
+    except json.JSONDecodeError as e:
+        logger.warning(f"解析AI返回的JSON时失败: {e}")
+        logger.warning(f"错误的JSON内容: {response_content}")
+        raise ValueError("AI模型返回的菜谱格式无效，无法解析。")
+    except ValidationError as e:
+        logger.warning(f"AI返回的JSON结构不符合预期的菜谱格式: {e}")
+        raise ValueError("AI模型返回的数据结构不正确。")
+
+
+def _recipe_confidence(recipe: Recipe, finish_reason: Optional[str]) -> float:
+    """
+    菜谱质量的启发式置信度 (0~1)：
+    输出被截断、食材或步骤过少、步骤描述过短、时长明显不合理都会扣分。
+    """
+    score = 1.0
+    if finish_reason not in (None, "stop"):
+        score -= 0.5
+    if len(recipe.ingredients) < 2:
+        score -= 0.3
+    if len(recipe.steps) < 2:
+        score -= 0.3
+    if any(len(step.description.strip()) < 4 for step in recipe.steps):
+        score -= 0.2
+    if recipe.cooking_time <= 0 or recipe.cooking_time > 600:
+        score -= 0.2
+    if not recipe.dish_name.strip():
+        score -= 0.5
+    return max(score, 0.0)
@@ -0,0 +1,351 @@
+"""
+菜谱批量导出/导入 (NDJSON)
+导出：使用服务端游标 + yield_per 分批读取列数据，不构造 ORM 对象，内存占用与表大小无关；
+导入：按批解析，批内和已有数据按内容哈希去重，每批以多行 INSERT 写入；
+content_hash 上的唯一索引配合“冲突时跳过”的 INSERT，保证并发导入或导入期间新生成的菜谱也不会重复。
+两者都统计处理行数和每秒行数。
+"""
+import json
+import time
+import hashlib
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from sqlalchemy import Integer, String, Text, bindparam, func, insert, inspect, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.models.recipe import Recipe
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+
+_table = Recipe.__table__
+
+# 导出的列（按此顺序输出）；ingredients/steps 以 JSON 数组而不是字符串导出
+EXPORT_COLUMNS = (
+    _table.c.id,
+    _table.c.recipe_name,
+    _table.c.ingredients,
+    _table.c.steps,
+    _table.c.image_url,
+    _table.c.cooking_time,
+    _table.c.difficulty,
+    _table.c.created_at,
+    _table.c.content_hash,
+)
+
+
+class TransferStats:
+    """导出/导入统计"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.rows = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.invalid = 0
+
+    def finish(self) -> "TransferStats":
+        self.finished = time.perf_counter()
+        return self
+
+    @property
+    def seconds(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "seconds": round(self.seconds, 3),
+            "rows_per_sec": round(self.rows_per_sec, 1),
+        }
+
+
+def _canonical_json(value: Union[str, List[Any], None]) -> str:
+    """把 JSON 字符串或列表规范化为稳定的文本，保证相同内容得到相同哈希"""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return value
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def content_hash(recipe_name: str, ingredients: Union[str, List[Any], None], steps: Union[str, List[Any], None],
+                 cooking_time: Optional[int], difficulty: Optional[str]) -> str:
+    """菜谱内容哈希：只覆盖菜谱本身，不包含 id、图片和创建时间"""
+    payload = "\x1f".join([
+        recipe_name or "",
+        _canonical_json(ingredients),
+        _canonical_json(steps),
+        str(cooking_time or 0),
+        difficulty or "",
+    ])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _json_or_raw(value: Optional[str]) -> Any:
+    if value is None:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def export_ndjson(db: Session, batch_size: int = DEFAULT_BATCH_SIZE,
+                  stats: Optional[TransferStats] = None) -> Iterator[str]:
+    """
+    逐行生成 NDJSON（每行以换行结尾）
+    yield_per 会启用服务端游标（MySQL 下为 SSCursor），每次只从数据库取 batch_size 行。
+    """
+    stats = stats or TransferStats()
+    query = select(*EXPORT_COLUMNS).order_by(_table.c.id).execution_options(yield_per=batch_size)
+    for row in db.execute(query):
+        (recipe_id, recipe_name, ingredients, steps, image_url,
+         cooking_time, difficulty, created_at, digest) = row
+        record = {
+            "id": recipe_id,
+            "recipe_name": recipe_name,
+            "ingredients": _json_or_raw(ingredients),
+            "steps": _json_or_raw(steps),
+            "image_url": image_url,
+            "cooking_time": cooking_time,
+            "difficulty": difficulty,
+            "created_at": created_at.isoformat() if isinstance(created_at, datetime) else created_at,
+            "content_hash": digest or content_hash(recipe_name, ingredients, steps, cooking_time, difficulty),
+        }
+        stats.rows += 1
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+    stats.finish()
+    logger.info(f"菜谱导出完成: {stats.as_dict()}")
+
+
+def parse_record(line: Union[str, bytes]) -> Optional[Dict[str, Any]]:
+    """
+    把一行 NDJSON 解析为待插入的列值；空行返回 None，格式错误抛出 ValueError。
+    导入数据中的 id 和 created_at 会被忽略，由数据库重新生成。
+    """
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    line = line.strip()
+    if not line:
+        return None
+
+    data = json.loads(line)
+    if not isinstance(data, dict) or not data.get("recipe_name"):
+        raise ValueError("缺少 recipe_name")
+
+    def as_text(value: Any) -> Optional[str]:
+        if value is None or isinstance(value, str):
+            return value
+        return json.dumps(value, ensure_ascii=False)
+
+    ingredients = as_text(data.get("ingredients"))
+    steps = as_text(data.get("steps"))
+    cooking_time = int(data.get("cooking_time") or 0)
+    difficulty = data.get("difficulty") or "简单"
+    record = {
+        "_openid": data.get("_openid") or "",
+        "recipe_name": data["recipe_name"],
+        "ingredients": ingredients,
+        "steps": steps,
+        "image_url": data.get("image_url"),
+        "cooking_time": cooking_time,
+        "difficulty": difficulty,
+        # 始终按内容重新计算，不信任导入数据中的哈希
+        "content_hash": content_hash(data["recipe_name"], ingredients, steps, cooking_time, difficulty),
+    }
+    _check_column_limits(record)
+    return record
+
+
+# MySQL TEXT 列最多 65535 字节，INT 列为 32 位有符号整数
+_TEXT_MAX_BYTES = 65535
+_INT_RANGE = (-2 ** 31, 2 ** 31 - 1)
+
+
+def _check_column_limits(record: Dict[str, Any]) -> None:
+    """
+    超出列长度或范围的值抛出 ValueError，使该行按无效行统计：
+    否则 MySQL 要么截断写入（存储内容与 content_hash 不再对应），要么整批插入失败。
+    """
+    for name, value in record.items():
+        if value is None:
+            continue
+        column_type = _table.c[name].type
+        if isinstance(column_type, String) and not isinstance(column_type, Text) and column_type.length:
+            if len(value) > column_type.length:
+                raise ValueError(f"{name} 超过 {column_type.length} 个字符")
+        elif isinstance(column_type, Text):
+            if len(value.encode("utf-8")) > _TEXT_MAX_BYTES:
+                raise ValueError(f"{name} 超过 {_TEXT_MAX_BYTES} 字节")
+        elif isinstance(column_type, Integer):
+            if not _INT_RANGE[0] <= value <= _INT_RANGE[1]:
+                raise ValueError(f"{name} 超出整数范围")
+
+
+# 唯一索引冲突的行直接跳过。不用 INSERT IGNORE：它会同时把截断、类型错误等降级为警告，
+# 写入与 content_hash 不一致的数据
+_INSERT_SKIPPING_DUPLICATES = {
+    "mysql": mysql_insert(_table).on_duplicate_key_update(id=_table.c.id),
+    "sqlite": sqlite_insert(_table).on_conflict_do_nothing(index_elements=["content_hash"]),
+}
+
+
+def _insert_skipping_duplicates(db: Session):
+    # 其他数据库没有通用语法，依赖插入前的预筛选
+    return _INSERT_SKIPPING_DUPLICATES.get(db.get_bind().dialect.name, insert(_table))
+
+
+def insert_batch(db: Session, records: List[Dict[str, Any]]) -> Tuple[int, int]:
+    """
+    插入一批记录：批内按内容哈希去重，再排除数据库中已有的哈希，剩余记录以多行 INSERT 写入。
+    返回 (插入数, 重复数)。
+    """
+    unique: Dict[str, Dict[str, Any]] = {}
+    for record in records:
+        unique.setdefault(record["content_hash"], record)
+
+    existing = set(
+        db.execute(select(_table.c.content_hash).where(_table.c.content_hash.in_(list(unique)))).scalars()
+    )
+    rows = [record for digest, record in unique.items() if digest not in existing]
+    inserted = 0
+    if rows:
+        # executemany 形式：语句只编译一次并被缓存，由 SQLAlchemy 的 insertmanyvalues
+        # （或 PyMySQL 的 executemany 改写）合并为多行 INSERT ... VALUES (...), (...)
+        # 上面的查询只是预筛选；查询之后由其他导入或新生成菜谱写入的相同哈希由唯一索引跳过
+        db.execute(_insert_skipping_duplicates(db), rows)
+        # ON DUPLICATE KEY UPDATE 的 rowcount 会把跳过的行也计入（PyMySQL 启用了 CLIENT_FOUND_ROWS），
+        # 改为在同一事务内统计这些哈希现在的行数：预筛选时它们都不存在，
+        # 事务快照（MySQL 默认可重复读）之外的并发写入不可见，因此即为本批插入的行数
+        inserted = db.execute(
+            select(func.count()).select_from(_table)
+            .where(_table.c.content_hash.in_([row["content_hash"] for row in rows]))
+        ).scalar_one()
+    db.commit()
+    return inserted, len(records) - inserted
+
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """把任意切分的字节块（例如 HTTP 请求体）重新切分为行"""
+    buffer = b""
+    for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        yield from lines
+    if buffer:
+        yield buffer
+
+
+def import_ndjson(db: Session, lines: Iterable[Union[str, bytes]], batch_size: int = DEFAULT_BATCH_SIZE,
+                  stats: Optional[TransferStats] = None) -> TransferStats:
+    """从逐行可迭代对象（文件、生成器）流式导入，内存占用只与 batch_size 有关"""
+    stats = stats or TransferStats()
+    batch: List[Dict[str, Any]] = []
+
+    def flush() -> None:
+        inserted, duplicates = insert_batch(db, batch)
+        stats.inserted += inserted
+        stats.duplicates += duplicates
+        batch.clear()
+
+    for line in lines:
+        try:
+            record = parse_record(line)
+        except (ValueError, TypeError) as e:
+            stats.invalid += 1
+            logger.warning(f"跳过无效的导入行: {e}")
+            continue
+        if record is None:
+            continue
+        stats.rows += 1
+        batch.append(record)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    stats.finish()
+    logger.info(f"菜谱导入完成: {stats.as_dict()}")
+    return stats
+
+
+def backfill_content_hashes(db: Session, batch_size: int = DEFAULT_BATCH_SIZE) -> TransferStats:
+    """为 content_hash 为空的历史菜谱补算哈希，使其参与导入去重"""
+    stats = TransferStats()
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(_table.c.id, _table.c.recipe_name, _table.c.ingredients, _table.c.steps,
+                   _table.c.cooking_time, _table.c.difficulty)
+            .where(_table.c.content_hash.is_(None), _table.c.id > last_id)
+            .order_by(_table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        # 与已有菜谱内容相同的行违反唯一索引，跳过后保持为空
+        db.execute(
+            update(_table)
+            .where(_table.c.id == bindparam("recipe_id"))
+            .values(content_hash=bindparam("digest"))
+            .prefix_with("IGNORE", dialect="mysql")
+            .prefix_with("OR IGNORE", dialect="sqlite"),
+            [
+                {"recipe_id": recipe_id, "digest": content_hash(name, ingredients, steps, cooking_time, difficulty)}
+                for recipe_id, name, ingredients, steps, cooking_time, difficulty in rows
+            ],
+        )
+        db.commit()
+        stats.rows += len(rows)
+        last_id = rows[-1][0]
+    stats.finish()
+    logger.info(f"菜谱内容哈希补算完成: {stats.as_dict()}")
+    return stats
+
+
+def ensure_unique_content_hash(engine) -> None:
+    """
+    保证 recipes.content_hash 上是唯一索引：早期版本创建的是普通索引，
+    先把重复的哈希置空（每个哈希保留 id 最小的一条），再重建为唯一索引。
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table(_table.name):
+        return
+    index = next(i for i in _table.indexes if "content_hash" in i.columns)
+    current = next((i for i in inspector.get_indexes(_table.name) if i["name"] == index.name), None)
+    if current is not None and current["unique"]:
+        return
+
+    with engine.begin() as conn:
+        duplicates = conn.execute(
+            select(_table.c.content_hash, func.min(_table.c.id))
+            .where(_table.c.content_hash.is_not(None))
+            .group_by(_table.c.content_hash)
+            .having(func.count() > 1)
+        ).all()
+        for digest, keep_id in duplicates:
+            conn.execute(
+                update(_table)
+                .where(_table.c.content_hash == digest, _table.c.id != keep_id)
+                .values(content_hash=None)
+            )
+        if current is not None:
+            index.drop(conn)
+        index.create(conn)
+    logger.info(f"content_hash 已改为唯一索引，置空了 {len(duplicates)} 组重复哈希")
@@ -8,7 +8,8 @@ from fastapi.exceptions import RequestValidationError
 import logging
 import time
 
-from app.api import chat
+from app.api import chat, health, admin
+from app.core.profiling import slow_request_profiler
 
 # 配置日志
 logging.basicConfig(
@@ -37,7 +38,16 @@ app.add_middleware(
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
     start_time = time.time()
-    response = await call_next(request)
+    # 慢请求采样：未开启时不产生任何额外开销
+    # （管理接口自身的按需采样请求不计入）
+    profile_started = None
+    if slow_request_profiler.enabled and not request.url.path.startswith("/admin"):
+        profile_started = slow_request_profiler.begin()
+    try:
+        response = await call_next(request)
+    finally:
+        if profile_started is not None:
+            slow_request_profiler.end(profile_started, request.method, request.url.path)
     process_time = time.time() - start_time
     response.headers["X-Process-Time"] = str(process_time)
     logger.info(f"Request: {request.method} {request.url.path} - Completed in {process_time:.4f}s")
@@ -46,6 +56,8 @@ async def add_process_time_header(request: Request, call_next):
 
 # 注册API路由
 app.include_router(chat.router)
+app.include_router(health.router)
+app.include_router(admin.router)
 
 
 # 根路径，提供一个简单的欢迎信息
@@ -94,6 +106,11 @@ async def startup_event():
             logger.info("正在初始化数据库，检查并创建数据表...")
             engine = db_core.get_engine()
             Base.metadata.create_all(bind=engine)
+            # 为已存在的表补充新增列（例如 recipes.content_hash）
+            from app.models.recipe import Recipe
+            from app.services import recipe_io
+            db_core.add_missing_columns(engine, Recipe.__table__)
+            recipe_io.ensure_unique_content_hash(engine)
             logger.info("数据库表结构初始化完成。")
         else:
             logger.warning("未检测到 MySQL 配置，跳过数据库初始化（请在云托管绑定 MySQL，并设置 DB_NAME 或 MYSQL_DATABASE）。")
@@ -101,6 +118,12 @@ async def startup_event():
     except Exception as e:
         logger.error(f"数据库初始化失败: {e}", exc_info=True)
         # 生产环境中，如果数据库是关键依赖，您可能希望在此处引发异常以停止启动
+
+    # 启动延后任务队列：依赖熔断期间排队的工作在依赖恢复后由后台重试
+    from app.services import get_deferred_queue, get_health_monitor
+    get_deferred_queue().start()
+    # 启动后台健康监控：/livez、/readyz 和健康检查端点读取其缓存结果
+    get_health_monitor().start()
     logger.info("应用启动完成")
 
 
@@ -108,6 +131,9 @@ async def startup_event():
 # 应用关闭事件
 @app.on_event("shutdown")
 async def shutdown_event():
+    from app.services import get_deferred_queue, get_health_monitor
+    await get_health_monitor().stop()
+    await get_deferred_queue().stop()
     logger.info("AI菜谱应用后端服务已关闭。")
 
 
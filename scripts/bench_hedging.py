@@ -0,0 +1,121 @@
+"""
+对冲请求基准测试
+用一个延迟呈重尾分布的假上游驱动 ModelCascade，对比开启/关闭对冲时的
+p50/p99 延迟以及额外调用开销。不访问真实的 DashScope 接口。
+
+用法: python scripts/bench_hedging.py [--requests 2000] [--concurrency 20]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.hedging import HedgeConfig  # noqa: E402
+from app.services.model_router import ModelCascade, ModelTier  # noqa: E402
+from app.services.qwen_vision_client import _parse_recipe  # noqa: E402
+
+
+RECIPE_JSON = json.dumps({
+    "dish_name": "番茄炒蛋",
+    "ingredients": [{"name": "番茄", "amount": "2", "unit": "个"}, {"name": "鸡蛋", "amount": "3", "unit": "个"}],
+    "steps": [{"step_number": 1, "description": "番茄切块备用"}, {"step_number": 2, "description": "鸡蛋打散炒熟"}],
+    "cooking_time": 15,
+    "difficulty": "简单",
+}, ensure_ascii=False)
+
+
+class FakeUpstream:
+    """
+    兼容 AsyncOpenAI 接口的假上游：
+    95% 的请求耗时约为 base 的对数正态分布，5% 的请求停顿 stall_factor 倍。
+    """
+
+    def __init__(self, base: float, stall_rate: float, stall_factor: float, seed: int, **_):
+        self.base = base
+        self.stall_rate = stall_rate
+        self.stall_factor = stall_factor
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.chat = types.SimpleNamespace(completions=self)
+
+    async def create(self, model, messages):
+        self.calls += 1
+        latency = self.base * self.random.lognormvariate(0, 0.25)
+        if self.random.random() < self.stall_rate:
+            latency *= self.stall_factor * self.random.paretovariate(1.5)
+        await asyncio.sleep(latency)
+        message = types.SimpleNamespace(content=RECIPE_JSON)
+        return types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=message, finish_reason="stop")],
+            usage=types.SimpleNamespace(prompt_tokens=0, completion_tokens=0),
+        )
+
+    async def close(self):
+        pass
+
+
+def _percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * (len(ordered) - 1)))]
+
+
+async def _run(args, hedge):
+    upstreams = []
+
+    def factory(**kwargs):
+        upstream = FakeUpstream(args.base, args.stall_rate, args.stall_factor, args.seed)
+        upstreams.append(upstream)
+        return upstream
+
+    tier = ModelTier(name="full", model="fake", base_url="", timeout=60.0, api_key="")
+    cascade = ModelCascade([tier], client_factory=factory, hedge=hedge)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await cascade.complete([], _parse_recipe)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    calls = sum(u.calls for u in upstreams)
+    return latencies, calls, cascade.snapshot()["full"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--base", type=float, default=0.02, help="典型上游延迟（秒）")
+    parser.add_argument("--stall-rate", type=float, default=0.03)
+    parser.add_argument("--stall-factor", type=float, default=15.0)
+    parser.add_argument("--budget", type=float, default=0.05)
+    parser.add_argument("--percentile", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    hedge = HedgeConfig(percentile=args.percentile, budget=args.budget, min_delay=0.0)
+    for name, config in (("无对冲", None), ("对冲", hedge)):
+        latencies, calls, stats = asyncio.run(_run(args, config))
+        extra = calls / args.requests - 1
+        print(
+            f"{name}: p50={_percentile(latencies, 0.5) * 1000:.1f}ms "
+            f"p99={_percentile(latencies, 0.99) * 1000:.1f}ms "
+            f"max={max(latencies) * 1000:.1f}ms "
+            f"上游调用={calls} 额外调用={extra:.1%} "
+            f"对冲胜出={stats.get('hedge_wins', 0)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
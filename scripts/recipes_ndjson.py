@@ -0,0 +1,159 @@
+"""
+菜谱批量导出/导入命令行工具 (NDJSON)
+
+用法:
+  python scripts/recipes_ndjson.py export [-o recipes.ndjson]
+  python scripts/recipes_ndjson.py import -i recipes.ndjson
+  python scripts/recipes_ndjson.py backfill-hashes
+  python scripts/recipes_ndjson.py bench --rows 1000000 --database-url sqlite:///bench.db
+
+默认连接应用配置的 MySQL（MYSQL_* 环境变量），可用 --database-url 指定其他数据库。
+导出写到标准输出或文件，导入从标准输入或文件读取；结束时在标准错误输出行数和每秒行数。
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, func, select  # noqa: E402
+from sqlalchemy.orm import Session, sessionmaker  # noqa: E402
+
+from app.core import database  # noqa: E402
+from app.models import Base  # noqa: E402
+from app.models.recipe import Recipe  # noqa: E402
+from app.services import recipe_io  # noqa: E402
+
+
+def _session(database_url: Optional[str]) -> Session:
+    if database_url:
+        engine = create_engine(database_url)
+    else:
+        engine = database.get_engine()
+    Base.metadata.create_all(bind=engine)
+    database.add_missing_columns(engine, Recipe.__table__)
+    recipe_io.ensure_unique_content_hash(engine)
+    return sessionmaker(bind=engine)()
+
+
+def _peak_rss_mb() -> float:
+    # Linux 下 ru_maxrss 的单位为 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _report(action: str, stats: recipe_io.TransferStats) -> None:
+    print(f"{action}: {json.dumps(stats.as_dict(), ensure_ascii=False)} 峰值内存={_peak_rss_mb():.0f}MB", file=sys.stderr)
+
+
+def cmd_export(args) -> None:
+    db = _session(args.database_url)
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    stats = recipe_io.TransferStats()
+    try:
+        for line in recipe_io.export_ndjson(db, batch_size=args.batch_size, stats=stats):
+            out.write(line)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        db.close()
+    _report("导出", stats)
+
+
+def cmd_import(args) -> None:
+    db = _session(args.database_url)
+    source = open(args.input, "r", encoding="utf-8") if args.input else sys.stdin
+    try:
+        stats = recipe_io.import_ndjson(db, source, batch_size=args.batch_size)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        db.close()
+    _report("导入", stats)
+
+
+def cmd_backfill(args) -> None:
+    db = _session(args.database_url)
+    try:
+        stats = recipe_io.backfill_content_hashes(db, batch_size=args.batch_size)
+    finally:
+        db.close()
+    _report("补算哈希", stats)
+
+
+def _synthetic_recipes(rows: int, duplicate_rate: float, seed: int):
+    """生成合成菜谱 NDJSON 行；约 duplicate_rate 比例的行与之前的行内容相同"""
+    rng = random.Random(seed)
+    foods = ["番茄", "鸡蛋", "猪肉", "牛肉", "土豆", "青椒", "木耳", "豆腐", "白菜", "胡萝卜", "虾仁", "鸡胸肉"]
+    for i in range(rows):
+        n = rng.randrange(i) if i and rng.random() < duplicate_rate else i
+        local = random.Random(n)
+        picked = local.sample(foods, 3)
+        yield json.dumps({
+            "recipe_name": f"{picked[0]}炒{picked[1]} #{n}",
+            "ingredients": [{"name": f, "amount": str(local.randint(1, 500)), "unit": "克"} for f in picked],
+            "steps": [
+                {"step_number": s, "description": f"第{s}步：处理{picked[(s - 1) % 3]}并翻炒均匀", "duration": local.randint(1, 10)}
+                for s in range(1, 5)
+            ],
+            "cooking_time": local.randint(5, 90),
+            "difficulty": local.choice(["简单", "中等", "困难"]),
+        }, ensure_ascii=False) + "\n"
+
+
+def cmd_bench(args) -> None:
+    """生成合成数据 -> 导入 -> 导出，报告每秒行数和峰值内存"""
+    db = _session(args.database_url)
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source.ndjson")
+        with open(source, "w", encoding="utf-8") as f:
+            f.writelines(_synthetic_recipes(args.rows, args.duplicate_rate, args.seed))
+
+        with open(source, "r", encoding="utf-8") as f:
+            stats = recipe_io.import_ndjson(db, f, batch_size=args.batch_size)
+        _report("导入", stats)
+
+        total = db.execute(select(func.count()).select_from(Recipe.__table__)).scalar()
+        print(f"表中行数: {total}", file=sys.stderr)
+
+        stats = recipe_io.TransferStats()
+        with open(os.path.join(tmp, "export.ndjson"), "w", encoding="utf-8") as out:
+            for line in recipe_io.export_ndjson(db, batch_size=args.batch_size, stats=stats):
+                out.write(line)
+        _report("导出", stats)
+    db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="SQLAlchemy 数据库 URL，默认使用应用的 MySQL 配置")
+    parser.add_argument("--batch-size", type=int, default=recipe_io.DEFAULT_BATCH_SIZE)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("export", help="导出 recipes 表为 NDJSON")
+    p.add_argument("-o", "--output", help="输出文件，默认标准输出")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("import", help="从 NDJSON 导入菜谱（按内容哈希去重）")
+    p.add_argument("-i", "--input", help="输入文件，默认标准输入")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("backfill-hashes", help="为历史菜谱补算 content_hash")
+    p.set_defaults(func=cmd_backfill)
+
+    p = sub.add_parser("bench", help="用合成数据测试导入/导出吞吐")
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p.add_argument("--duplicate-rate", type=float, default=0.05)
+    p.add_argument("--seed", type=int, default=7)
+    p.set_defaults(func=cmd_bench)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()